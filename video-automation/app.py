@@ -4,12 +4,20 @@ Video Automation Web UI
 User-friendly interface for AI video generation
 """
 
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_from_directory, abort
+from werkzeug.security import safe_join
 import os
 import json
+import subprocess
 from datetime import datetime
 import threading
+import uuid
 from video_automation import VideoAutomation
+from job_context import JobContext
+from topic_ingest import TopicIngestor, parse_topics
+from scheduler import PIPELINES
+from video_variants import PREVIEW_VARIANT, variant_path
+from render_webhooks import PendingRenderStore, WebhookRenderCoordinator
 from loguru import logger
 from dotenv import load_dotenv
 
@@ -17,11 +25,129 @@ load_dotenv()
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
+# Let a fronting nginx/Apache stream files itself instead of the Flask process
+app.config['USE_X_SENDFILE'] = os.getenv('USE_X_SENDFILE', 'false').lower() == 'true'
+
+OUTPUT_DIR = os.path.abspath('output')
+PREVIEW_DIR = os.path.join(OUTPUT_DIR, 'previews')
 
 # Store job status
 job_status = {}
 
-def run_video_generation(job_id, topic, api_keys):
+# Created up front so parallel jobs don't race to initialise it
+app.recent_videos = []
+
+# Shared so the duplicate index and ID counter are loaded once per process
+topic_ingestor = None
+topic_ingestor_lock = threading.Lock()
+
+# One lock per preview so concurrent viewers trigger a single transcode
+preview_locks = {}
+preview_locks_guard = threading.Lock()
+
+def local_video_urls(video_path):
+    """Build the streaming and preview URLs for a video saved under output/"""
+    filename = os.path.relpath(os.path.abspath(video_path), OUTPUT_DIR).replace(os.sep, '/')
+    return f"/videos/{filename}", f"/previews/{filename}"
+
+def build_preview(filename):
+    """Path of a low-bitrate preview proxy, transcoded once and reused until the source changes"""
+    source_path = safe_join(OUTPUT_DIR, filename)
+    if source_path is None or not os.path.isfile(source_path):
+        abort(404)
+    
+    # Videos that went through publish_variants already got a preview in the same ffmpeg pass
+    derived_path = variant_path(source_path, PREVIEW_VARIANT)
+    if os.path.exists(derived_path) and os.path.getmtime(derived_path) >= os.path.getmtime(source_path):
+        return derived_path
+    
+    preview_name = f"{os.path.splitext(filename)[0]}_preview.mp4"
+    preview_path = os.path.join(PREVIEW_DIR, preview_name)
+    
+    with preview_locks_guard:
+        lock = preview_locks.setdefault(preview_name, threading.Lock())
+    
+    with lock:
+        if os.path.exists(preview_path) and os.path.getmtime(preview_path) >= os.path.getmtime(source_path):
+            return preview_path
+        
+        logger.info(f"Transcoding preview for {filename}")
+        os.makedirs(os.path.dirname(preview_path), exist_ok=True)
+        tmp_path = f"{preview_path}.part.mp4"
+        cmd = [
+            'ffmpeg', '-nostdin', '-y', '-v', 'error',
+            '-i', source_path,
+            '-vf', 'scale=-2:360',
+            '-c:v', 'libx264', '-preset', 'veryfast',
+            '-b:v', '400k', '-maxrate', '500k', '-bufsize', '1000k',
+            '-c:a', 'aac', '-b:a', '64k',
+            '-movflags', '+faststart',  # moov atom first so players can scrub immediately
+            tmp_path
+        ]
+        try:
+            subprocess.run(cmd, check=True)
+            os.replace(tmp_path, preview_path)
+        finally:
+            # Only left behind when the transcode failed
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    return preview_path
+
+def get_topic_ingestor():
+    """Create the topic ingestor on first use"""
+    global topic_ingestor
+    with topic_ingestor_lock:
+        if topic_ingestor is None:
+            topic_ingestor = TopicIngestor(VideoAutomation().topics_sheet)
+        return topic_ingestor
+
+def finish_job(job_id, topic, title, video_path, video_url):
+    """Mark a job completed and add it to the recent videos list"""
+    local_url, preview_url = local_video_urls(video_path)
+    job_status[job_id] = {
+        'status': 'completed',
+        'progress': 'Video created successfully!',
+        'video_url': video_url,
+        'video_title': title,
+        'video_path': video_path,
+        'local_url': local_url,
+        'preview_url': preview_url,
+        'error': None
+    }
+    
+    # Save to recent videos in memory
+    app.recent_videos.insert(0, {
+        'title': title,
+        'topic': topic,
+        'video_url': video_url,
+        'local_url': local_url,
+        'preview_url': preview_url,
+        'created_at': datetime.now().isoformat()
+    })
+
+def update_job_status(job_id, fields):
+    """Apply progress reported by webhook render jobs"""
+    if fields.get('status') == 'completed':
+        finish_job(job_id, fields['topic'], fields['video_title'], fields['video_path'], fields['video_url'])
+        return
+    
+    job = job_status.setdefault(job_id, {'status': 'processing', 'progress': '', 'video_url': None, 'error': None})
+    job.update(fields)
+
+# Webhook completion mode: renders wait on fal's callback instead of a blocked thread
+render_webhooks = None
+if os.getenv('FAL_WEBHOOK_BASE_URL'):
+    render_webhooks = WebhookRenderCoordinator(
+        os.getenv('FAL_WEBHOOK_BASE_URL'),
+        PendingRenderStore(os.getenv('PENDING_RENDERS_PATH', 'config/pending_renders.json')),
+        update_job_status
+    )
+    # Under the debug reloader only the serving child process should poll
+    if __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        render_webhooks.start_poller()
+
+def run_video_generation(job_id, topic, api_keys, pipeline='single'):
     """Run video generation in background thread"""
     try:
         job_status[job_id] = {
@@ -31,19 +157,17 @@ def run_video_generation(job_id, topic, api_keys):
             'error': None
         }
         
-        # Create automation instance with custom API keys
-        automation = VideoAutomation()
-        automation.grok_api_key = api_keys['grokApiKey']
-        os.environ['FAL_KEY'] = api_keys['falApiKey']
+        # Create automation instance with this job's API keys (nothing process-global is touched)
+        context = JobContext.from_env()
+        context.grok_api_key = api_keys['grokApiKey']
+        context.fal_key = api_keys['falApiKey']
+        automation = PIPELINES[pipeline](context)
         
         # Handle YouTube credentials if provided
         if api_keys.get('useYoutube') and api_keys.get('youtubeClientSecrets'):
             try:
-                # Save YouTube credentials temporarily
-                os.makedirs('config', exist_ok=True)
-                with open('config/youtube_client_secrets.json', 'w') as f:
-                    f.write(api_keys['youtubeClientSecrets'])
-                # Re-setup YouTube with new credentials
+                # Switch to the job's YouTube account; tokens are cached per account
+                automation.context = context.for_youtube_account(json.loads(api_keys['youtubeClientSecrets']))
                 automation.setup_youtube()
             except Exception as e:
                 logger.error(f"Failed to setup YouTube: {str(e)}")
@@ -51,36 +175,35 @@ def run_video_generation(job_id, topic, api_keys):
         
         # Override to use provided topic instead of Google Sheets
         job_status[job_id]['progress'] = 'Generating script with Grok...'
-        script_data = automation.generate_script(topic)
+        if pipeline == 'multi':
+            script_data = automation.generate_multi_scene_script(topic)
+        else:
+            script_data = automation.generate_script(topic)
+        
+        upload = bool(api_keys.get('useYoutube') and automation.youtube)
+        
+        if render_webhooks:
+            # The rest of the pipeline runs when fal calls back, so this thread can end here
+            job_status[job_id]['progress'] = 'Submitting video renders to Veo 3...'
+            render_webhooks.start(job_id, pipeline, automation, script_data, topic=topic, upload=upload)
+            return
         
         job_status[job_id]['progress'] = 'Creating video with Veo 3...'
-        video_path = automation.generate_video(script_data)
+        if pipeline == 'multi':
+            clip_paths = automation.generate_checked_clips(script_data['scenes'])
+            video_path = automation.stitch_videos(clip_paths, script_data)
+        else:
+            video_path = automation.generate_checked_video(script_data)
         
-        if api_keys.get('useYoutube') and automation.youtube:
+        if upload:
             job_status[job_id]['progress'] = 'Uploading to YouTube...'
             video_url = automation.upload_to_youtube(video_path, script_data)
+            automation.publish_variants(None, video_path, script_data)
         else:
             job_status[job_id]['progress'] = 'Saving video locally...'
             video_url = None
         
-        job_status[job_id] = {
-            'status': 'completed',
-            'progress': 'Video created successfully!',
-            'video_url': video_url,
-            'video_title': script_data['title'],
-            'video_path': video_path,
-            'error': None
-        }
-        
-        # Save to recent videos in memory
-        if not hasattr(app, 'recent_videos'):
-            app.recent_videos = []
-        app.recent_videos.insert(0, {
-            'title': script_data['title'],
-            'topic': topic,
-            'video_url': video_url,
-            'created_at': datetime.now().isoformat()
-        })
+        finish_job(job_id, topic, script_data['title'], video_path, video_url)
         
     except Exception as e:
         logger.error(f"Error in job {job_id}: {str(e)}")
@@ -119,6 +242,7 @@ def generate_video():
     """Start video generation"""
     data = request.json
     topic = data.get('topic')
+    pipeline = data.get('pipeline', 'single')
     api_keys = {
         'grokApiKey': data.get('grokApiKey'),
         'falApiKey': data.get('falApiKey'),
@@ -132,11 +256,14 @@ def generate_video():
     if not api_keys['grokApiKey'] or not api_keys['falApiKey']:
         return jsonify({'success': False, 'error': 'API keys are required'})
     
+    if pipeline not in PIPELINES:
+        return jsonify({'success': False, 'error': f"Unknown pipeline '{pipeline}'"})
+    
     # Create job ID
-    job_id = f"job_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    job_id = f"job_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
     
     # Start background thread
-    thread = threading.Thread(target=run_video_generation, args=(job_id, topic, api_keys))
+    thread = threading.Thread(target=run_video_generation, args=(job_id, topic, api_keys, pipeline))
     thread.start()
     
     return jsonify({'success': True, 'job_id': job_id})
@@ -149,6 +276,35 @@ def get_status(job_id):
     
     return jsonify({'success': True, 'job': job_status[job_id]})
 
+@app.route('/videos/<path:filename>')
+def serve_video(filename):
+    """Stream a rendered video from output/ with Range, ETag and conditional GET support"""
+    return send_from_directory(OUTPUT_DIR, filename, conditional=True, etag=True, max_age=3600)
+
+@app.route('/previews/<path:filename>')
+def serve_preview(filename):
+    """Stream a small preview proxy of a rendered video, transcoding it on first request"""
+    try:
+        preview_path = build_preview(filename)
+    except (subprocess.CalledProcessError, OSError) as e:
+        # OSError covers ffmpeg missing from PATH
+        logger.error(f"Preview transcode failed for {filename}: {str(e)}")
+        return jsonify({'success': False, 'error': 'Failed to create preview'}), 500
+    
+    return send_from_directory(os.path.dirname(preview_path), os.path.basename(preview_path),
+                               conditional=True, etag=True, max_age=3600)
+
+@app.route('/api/fal-webhook/<job_id>/<token>', methods=['POST'])
+def fal_webhook(job_id, token):
+    """Receive fal's completion callback and resume the waiting job"""
+    if not render_webhooks:
+        return jsonify({'success': False, 'error': 'Webhook mode is disabled'}), 404
+    
+    if not render_webhooks.handle_webhook(job_id, token, request.get_json(silent=True) or {}):
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    
+    return jsonify({'success': True})
+
 @app.route('/api/recent-videos')
 def get_recent_videos():
     """Get recently created videos"""
@@ -169,15 +325,33 @@ def add_topic():
         return jsonify({'success': False, 'error': 'Topic is required'})
     
     try:
-        automation = VideoAutomation()
-        # Find next ID
-        records = automation.topics_sheet.get_all_records()
-        next_id = f"{len(records) + 1:03d}"
+        result = get_topic_ingestor().ingest([topic])
+        if not result['added']:
+            return jsonify({'success': False, 'error': 'Topic already exists'})
+        
+        return jsonify({'success': True, 'message': 'Topic added successfully', 'id': result['ids'][0]})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/add-topics', methods=['POST'])
+def add_topics():
+    """Bulk add topics from an uploaded CSV/JSON file or a CSV/JSON request body"""
+    try:
+        upload = request.files.get('file')
+        if upload:
+            fmt = 'json' if upload.filename.lower().endswith('.json') else 'csv'
+            # utf-8-sig drops the byte order mark Excel puts in front of CSV exports
+            payload = upload.read().decode('utf-8-sig')
+        else:
+            fmt = 'json' if request.is_json else 'csv'
+            payload = request.get_data().decode('utf-8-sig')
         
-        # Add new row
-        automation.topics_sheet.append_row([next_id, '', topic])
+        topics = parse_topics(payload, fmt)
+        if not topics:
+            return jsonify({'success': False, 'error': 'No topics found'})
         
-        return jsonify({'success': True, 'message': 'Topic added successfully'})
+        result = get_topic_ingestor().ingest(topics)
+        return jsonify({'success': True, **result})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
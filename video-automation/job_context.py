@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Per-job credentials and per-account API clients
+Lets concurrent jobs use different accounts without touching process-global state
+"""
+
+import os
+import json
+import hashlib
+import threading
+from typing import Dict, Optional
+import requests
+import fal_client
+from googleapiclient.discovery import build
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials as OAuthCredentials
+from google_auth_oauthlib.flow import InstalledAppFlow
+from loguru import logger
+
+YOUTUBE_SCOPES = ['https://www.googleapis.com/auth/youtube.upload']
+
+
+def fingerprint(secret: Optional[str]) -> str:
+    """Stable pool key for a secret that doesn't keep the secret itself"""
+    return hashlib.sha256((secret or '').encode()).hexdigest()
+
+
+def client_config_from_token(token_path: Optional[str]) -> Optional[Dict]:
+    """Rebuild an account's OAuth client config from its cached token, which keeps the client ID and secret"""
+    if not token_path or not os.path.exists(token_path):
+        return None
+    with open(token_path, 'r') as f:
+        token = json.load(f)
+    if not token.get('client_id') or not token.get('client_secret'):
+        return None
+    return {
+        'installed': {
+            'client_id': token['client_id'],
+            'client_secret': token['client_secret'],
+            'auth_uri': 'https://accounts.google.com/o/oauth2/auth',
+            'token_uri': token.get('token_uri', 'https://oauth2.googleapis.com/token'),
+            'redirect_uris': ['http://localhost']
+        }
+    }
+
+
+class JobContext:
+    """Credentials for one job, passed explicitly to the fal, Grok and YouTube clients"""
+
+    def __init__(self, grok_api_key: str, fal_key: str, grok_api_url: Optional[str] = None,
+                 youtube_client_config: Optional[Dict] = None, youtube_token_path: Optional[str] = None):
+        self.grok_api_key = grok_api_key
+        self.grok_api_url = grok_api_url or os.getenv('GROK_API_URL', 'https://api.x.ai/v1/chat/completions')
+        self.fal_key = fal_key
+        self.youtube_client_config = youtube_client_config
+        self._youtube_token_path = youtube_token_path
+
+    @classmethod
+    def from_env(cls) -> 'JobContext':
+        """Build the context the CLI and scheduler use, from .env settings"""
+        client_config = None
+        secrets_path = os.getenv('YOUTUBE_CLIENT_SECRETS_PATH')
+        if secrets_path and os.path.exists(secrets_path):
+            with open(secrets_path, 'r') as f:
+                client_config = json.load(f)
+
+        return cls(
+            grok_api_key=os.getenv('GROK_API_KEY'),
+            fal_key=os.getenv('FAL_KEY') or os.getenv('FAL_API_KEY'),
+            grok_api_url=os.getenv('GROK_API_URL'),
+            youtube_client_config=client_config,
+            youtube_token_path=os.getenv('YOUTUBE_CREDENTIALS_PATH')
+        )
+
+    def for_youtube_account(self, client_config: Dict) -> 'JobContext':
+        """Copy of this context that uploads to another YouTube account, with its own token cache"""
+        return JobContext(
+            grok_api_key=self.grok_api_key,
+            fal_key=self.fal_key,
+            grok_api_url=self.grok_api_url,
+            youtube_client_config=client_config
+        )
+
+    @property
+    def youtube_account(self) -> Optional[str]:
+        """OAuth client ID identifying the YouTube account, if one is configured"""
+        if not self.youtube_client_config:
+            return None
+        section = self.youtube_client_config.get('installed') or self.youtube_client_config.get('web') or {}
+        return section.get('client_id')
+
+    @property
+    def youtube_token_path(self) -> str:
+        """Where the OAuth token for this account is cached"""
+        if self._youtube_token_path:
+            return self._youtube_token_path
+        digest = fingerprint(self.youtube_account)[:16]
+        return os.path.join('config', 'youtube_tokens', f"{digest}.json")
+
+
+class ClientPool:
+    """Caches API clients per account so jobs for the same account share connections"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fal_clients = {}
+        self._sessions = {}
+        self._fal_queue_sessions = {}
+        self._youtube_creds = {}
+        self._youtube_locks = {}
+
+    def fal(self, context: JobContext) -> fal_client.SyncClient:
+        """fal client bound to the job's key instead of the FAL_KEY environment variable"""
+        key = fingerprint(context.fal_key)
+        with self._lock:
+            if key not in self._fal_clients:
+                self._fal_clients[key] = fal_client.SyncClient(key=context.fal_key)
+            return self._fal_clients[key]
+
+    def fal_queue(self, context: JobContext) -> requests.Session:
+        """HTTP session for fal's queue REST API (webhook submits, status and result polling)"""
+        key = fingerprint(context.fal_key)
+        with self._lock:
+            if key not in self._fal_queue_sessions:
+                session = requests.Session()
+                session.headers.update({'Authorization': f'Key {context.fal_key}'})
+                self._fal_queue_sessions[key] = session
+            return self._fal_queue_sessions[key]
+
+    def grok(self, context: JobContext) -> requests.Session:
+        """HTTP session carrying the job's Grok API key"""
+        key = fingerprint(context.grok_api_key)
+        with self._lock:
+            if key not in self._sessions:
+                session = requests.Session()
+                session.headers.update({
+                    'Authorization': f'Bearer {context.grok_api_key}',
+                    'Content-Type': 'application/json'
+                })
+                self._sessions[key] = session
+            return self._sessions[key]
+
+    def youtube(self, context: JobContext):
+        """YouTube service for the job's account, authorising it on first use"""
+        token_path = context.youtube_token_path
+        with self._lock:
+            account_lock = self._youtube_locks.setdefault(token_path, threading.Lock())
+
+        # Refreshing or running the OAuth flow mutates the credentials, one job at a time per account
+        with account_lock:
+            creds = self._youtube_creds.get(token_path)
+            if creds is None and os.path.exists(token_path):
+                with open(token_path, 'r') as token:
+                    creds = OAuthCredentials.from_authorized_user_info(json.load(token), YOUTUBE_SCOPES)
+
+            if not creds or not creds.valid:
+                if creds and creds.expired and creds.refresh_token:
+                    creds.refresh(Request())
+                else:
+                    logger.info(f"Authorising YouTube account {context.youtube_account}")
+                    flow = InstalledAppFlow.from_client_config(context.youtube_client_config, YOUTUBE_SCOPES)
+                    creds = flow.run_local_server(port=0)
+
+                os.makedirs(os.path.dirname(token_path) or '.', exist_ok=True)
+                with open(token_path, 'w') as token:
+                    token.write(creds.to_json())
+
+            self._youtube_creds[token_path] = creds
+
+        # The discovery service wraps httplib2, which is not thread-safe, so build one per job
+        return build('youtube', 'v3', credentials=creds, cache_discovery=False)
+
+
+# Shared by every job in the process
+client_pool = ClientPool()
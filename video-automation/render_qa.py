@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Render QA
+Catches bad Veo renders (black, frozen, duplicated, wrong orientation,
+truncated) before they reach YouTube and burn upload quota
+"""
+
+import os
+import json
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import numpy as np
+from loguru import logger
+
+# Frames are decoded as tiny grayscale thumbnails, enough to judge content
+SAMPLE_FPS = 4
+FRAME_SIZE = 64
+
+# blackdetect's defaults: a pixel is dark below 10% full-range luma (0-255), and a frame
+# is black once 98% of its pixels are dark, so night skies with a bright subject pass
+BLACK_LUMA = 0.1 * 255
+BLACK_PIXEL_RATIO = 0.98
+MAX_BLACK_RATIO = 0.5
+
+# Mean absolute difference between consecutive thumbnails below which nothing moved
+FROZEN_DIFF = 0.75
+MAX_FROZEN_SECONDS = 3.0
+
+# Correlation between two scenes' mean-subtracted average frames above which they are the
+# same shot; unlike an absolute difference it doesn't call every pair of dark scenes a match
+DUPLICATE_CORRELATION = 0.97
+# Average frames flatter than this (std of luma) have no layout to compare
+MIN_SIGNATURE_STD = 0.5
+
+# Allowed relative error on width/height versus the requested aspect ratio
+ASPECT_TOLERANCE = 0.05
+
+# A render shorter than this fraction of the requested duration is treated as truncated
+MIN_DURATION_RATIO = 0.9
+
+
+def longest_run(mask: np.ndarray) -> int:
+    """Length of the longest run of True values in a 1-D boolean array"""
+    if not mask.any():
+        return 0
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return int((ends - starts).max())
+
+
+def black_ratio(luma: np.ndarray) -> float:
+    """Share of frames (rows of an (n, pixels) luma array) that are black"""
+    dark_share = (luma < BLACK_LUMA).mean(axis=1)
+    return float((dark_share >= BLACK_PIXEL_RATIO).mean())
+
+
+def frozen_seconds(luma: np.ndarray) -> float:
+    """Longest stretch, in seconds, over which consecutive frames barely change"""
+    if len(luma) < 2:
+        return 0.0
+    motion = np.abs(np.diff(luma, axis=0)).mean(axis=1)
+    return longest_run(motion < FROZEN_DIFF) / SAMPLE_FPS
+
+
+def duplicate_pairs(signatures: np.ndarray) -> List[tuple]:
+    """(later, earlier) index pairs of signatures that show the same shot"""
+    centered = signatures - signatures.mean(axis=1, keepdims=True)
+    std = centered.std(axis=1)
+    comparable = std >= MIN_SIGNATURE_STD
+    # Pearson correlation of every pair at once; flat signatures are left out
+    unit = np.divide(centered, std[:, None] * np.sqrt(signatures.shape[1]),
+                     out=np.zeros_like(centered), where=comparable[:, None])
+    correlation = unit @ unit.T
+    same = (correlation > DUPLICATE_CORRELATION) & comparable[:, None] & comparable[None, :]
+    later, earlier = np.nonzero(np.tril(same, k=-1))
+    return list(zip(later.tolist(), earlier.tolist()))
+
+
+class RenderQA:
+    def __init__(self):
+        self.enabled = os.getenv('RENDER_QA_ENABLED', 'true').lower() == 'true'
+        self.max_retries = int(os.getenv('RENDER_QA_MAX_RETRIES', '1'))
+
+        if self.enabled and not (shutil.which('ffmpeg') and shutil.which('ffprobe')):
+            logger.warning("ffmpeg/ffprobe not found, render QA is disabled")
+            self.enabled = False
+
+    def probe(self, video_path: str) -> Optional[Dict]:
+        """Read video dimensions and duration with ffprobe"""
+        cmd = [
+            'ffprobe', '-v', 'error',
+            '-select_streams', 'v:0',
+            '-show_entries', 'stream=width,height:format=duration',
+            '-of', 'json',
+            video_path
+        ]
+        result = subprocess.run(cmd, capture_output=True, stdin=subprocess.DEVNULL)
+        if result.returncode != 0:
+            return None
+
+        info = json.loads(result.stdout or b'{}')
+        if not info.get('streams'):
+            return None
+        stream = info['streams'][0]
+        # Streams without a container duration report 'N/A'; the decoded frame count covers them
+        try:
+            duration = float(info.get('format', {}).get('duration'))
+        except (TypeError, ValueError):
+            duration = None
+        return {
+            'width': int(stream['width']),
+            'height': int(stream['height']),
+            'duration': duration
+        }
+
+    def decode_frames(self, video_path: str) -> Optional[np.ndarray]:
+        """Decode downsampled grayscale frames through an ffmpeg pipe into an (n, h, w) array"""
+        cmd = [
+            'ffmpeg', '-nostdin', '-v', 'error',
+            '-i', video_path,
+            # Expand limited-range video so encoder black decodes near 0 rather than 16
+            '-vf', f'fps={SAMPLE_FPS},scale={FRAME_SIZE}:{FRAME_SIZE}:out_range=full,format=gray',
+            '-f', 'rawvideo',
+            '-'
+        ]
+        result = subprocess.run(cmd, capture_output=True)
+        if result.returncode != 0:
+            return None
+
+        frame_bytes = FRAME_SIZE * FRAME_SIZE
+        count = len(result.stdout) // frame_bytes
+        frames = np.frombuffer(result.stdout, dtype=np.uint8, count=count * frame_bytes)
+        return frames.reshape(count, FRAME_SIZE, FRAME_SIZE)
+
+    def inspect(self, video_path: str, aspect_ratio: str, duration: float) -> Dict:
+        """Run every single-video check; returns the issues and the decoded frames"""
+        issues = []
+
+        info = self.probe(video_path)
+        if info is None:
+            return {'issues': ['unreadable or truncated file'], 'frames': None}
+
+        # Orientation / aspect ratio
+        target_w, target_h = (float(part) for part in aspect_ratio.split(':'))
+        expected = target_w / target_h
+        actual = info['width'] / info['height']
+        if abs(actual - expected) / expected > ASPECT_TOLERANCE:
+            issues.append(f"wrong aspect ratio {info['width']}x{info['height']} (expected {aspect_ratio})")
+
+        frames = self.decode_frames(video_path)
+        if frames is None or len(frames) == 0:
+            issues.append('video stream could not be decoded')
+            return {'issues': issues, 'frames': None}
+
+        # Truncation: trust the decoded frame count over container metadata
+        decoded_seconds = len(frames) / SAMPLE_FPS
+        container_seconds = decoded_seconds if info['duration'] is None else info['duration']
+        if min(container_seconds, decoded_seconds) < duration * MIN_DURATION_RATIO:
+            issues.append(f"truncated render ({decoded_seconds:.1f}s of {duration:.0f}s)")
+
+        luma = frames.reshape(len(frames), -1).astype(np.float32)
+
+        black = black_ratio(luma)
+        if black > MAX_BLACK_RATIO:
+            issues.append(f"{black:.0%} black frames")
+
+        frozen = frozen_seconds(luma)
+        if frozen > MAX_FROZEN_SECONDS:
+            issues.append(f"frozen for {frozen:.1f}s")
+
+        return {'issues': issues, 'frames': luma}
+
+    def check_video(self, video_path: str, aspect_ratio: str, duration: float = 8.0) -> List[str]:
+        """Check one rendered video; returns a list of problems (empty if it passed)"""
+        if not self.enabled:
+            return []
+
+        issues = self.inspect(video_path, aspect_ratio, duration)['issues']
+        if issues:
+            logger.warning(f"Render QA failed for {video_path}: {', '.join(issues)}")
+        else:
+            logger.info(f"Render QA passed for {video_path}")
+        return issues
+
+    def check_scenes(self, clip_paths: List[str], aspect_ratio: str, duration: float = 8.0) -> Dict[int, List[str]]:
+        """Check every scene clip and flag repeats; returns {scene index: problems} for failures only"""
+        if not self.enabled:
+            return {}
+
+        # ffmpeg does the decoding, so the clips can be inspected in parallel
+        with ThreadPoolExecutor(max_workers=len(clip_paths) or 1) as pool:
+            reports = list(pool.map(lambda path: self.inspect(path, aspect_ratio, duration), clip_paths))
+
+        failed = {idx: report['issues'] for idx, report in enumerate(reports) if report['issues']}
+
+        # Duplicated scenes: compare each clip's average frame against every other clip at once
+        decoded = [idx for idx, report in enumerate(reports) if report['frames'] is not None]
+        if len(decoded) > 1:
+            signatures = np.stack([reports[idx]['frames'].mean(axis=0) for idx in decoded])
+            for i, j in duplicate_pairs(signatures):
+                failed.setdefault(decoded[i], []).append(f"duplicate of scene {decoded[j] + 1}")
+
+        for idx, issues in sorted(failed.items()):
+            logger.warning(f"Render QA failed for scene {idx + 1} ({clip_paths[idx]}): {', '.join(issues)}")
+        if not failed:
+            logger.info(f"Render QA passed for {len(clip_paths)} scenes")
+        return failed
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Hedged Veo rendering
+Tracks queue-wait and render-time percentiles per fal endpoint and, when a
+render runs past them, races a duplicate request against it within a budget
+"""
+
+import os
+import json
+import time
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+import fal_client
+from loguru import logger
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Default Veo 3 tier used by both pipelines
+VEO_ENDPOINT = "fal-ai/veo3/fast"
+
+# How often pending requests are polled
+POLL_INTERVAL = 1.0
+
+# Samples kept per endpoint and phase
+WINDOW_SIZE = 200
+
+# Most hedge tokens that can be saved up, so a quiet period can't fund a burst of duplicates
+MAX_HEDGE_TOKENS = 2.0
+
+
+class LatencyTracker:
+    """Rolling queue-wait/render-time samples per endpoint plus the hedge budget, persisted between runs"""
+
+    def __init__(self, state_path: str, budget_ratio: float):
+        self.state_path = state_path
+        self.budget_ratio = budget_ratio
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._hedge_tokens = 0.0
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable render stats {self.state_path}: {str(e)}")
+            return
+        for key, values in state.get('samples', {}).items():
+            self._samples[key] = deque(values, maxlen=WINDOW_SIZE)
+        self._hedge_tokens = state.get('hedge_tokens', 0.0)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+        state = {
+            'samples': {key: list(values) for key, values in self._samples.items()},
+            'hedge_tokens': self._hedge_tokens
+        }
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def record(self, endpoint: str, phase: str, seconds: float):
+        """Add one observed duration"""
+        with self._lock:
+            key = f"{endpoint}:{phase}"
+            self._samples.setdefault(key, deque(maxlen=WINDOW_SIZE)).append(round(seconds, 2))
+            self.save()
+
+    def percentile(self, endpoint: str, phase: str, pct: float, min_samples: int) -> Optional[float]:
+        """Observed percentile for an endpoint phase, or None until enough samples exist"""
+        with self._lock:
+            values = sorted(self._samples.get(f"{endpoint}:{phase}", ()))
+        if len(values) < min_samples:
+            return None
+        index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+        return values[index]
+
+    def earn_hedge(self):
+        """Every primary render earns a fraction of a hedge"""
+        with self._lock:
+            self._hedge_tokens = min(MAX_HEDGE_TOKENS, self._hedge_tokens + self.budget_ratio)
+            self.save()
+
+    def spend_hedge(self) -> bool:
+        """Take one hedge from the budget if one is available"""
+        with self._lock:
+            if self._hedge_tokens < 1.0:
+                return False
+            self._hedge_tokens -= 1.0
+            self.save()
+            return True
+
+
+class RenderAttempt:
+    """One submitted fal request and what we have observed about it"""
+
+    def __init__(self, client: fal_client.SyncClient, endpoint: str, arguments: Dict, label: str):
+        self.endpoint = endpoint
+        self.label = label
+        self.handle = client.submit(endpoint, arguments=arguments)
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.logs_seen = 0
+
+    def poll(self) -> bool:
+        """Refresh status, log new progress lines, return True once the request completed"""
+        status = self.handle.status(with_logs=True)
+        if isinstance(status, fal_client.Queued):
+            return False
+
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+
+        logs = status.logs or []
+        for log in logs[self.logs_seen:]:
+            logger.info(f"Veo3 Progress ({self.label}): {log['message']}")
+        self.logs_seen = len(logs)
+
+        return isinstance(status, fal_client.Completed)
+
+    def queue_wait(self) -> float:
+        return (self.started_at or time.monotonic()) - self.submitted_at
+
+    def render_time(self) -> float:
+        return time.monotonic() - self.started_at if self.started_at else 0.0
+
+    def cancel(self):
+        try:
+            self.handle.cancel()
+            logger.info(f"Cancelled {self.label} request {self.handle.request_id}")
+        except Exception as e:
+            logger.warning(f"Could not cancel {self.label} request {self.handle.request_id}: {str(e)}")
+
+
+class RenderScheduler:
+    """Runs fal renders, hedging the slow ones with a duplicate request"""
+
+    def __init__(self, client: fal_client.SyncClient, tracker: LatencyTracker):
+        self.client = client
+        self.tracker = tracker
+        self.enabled = os.getenv('RENDER_HEDGING_ENABLED', 'true').lower() == 'true'
+        self.percentile = float(os.getenv('RENDER_HEDGE_PERCENTILE', '95'))
+        self.min_samples = int(os.getenv('RENDER_HEDGE_MIN_SAMPLES', '20'))
+        self.hedge_endpoint = os.getenv('RENDER_HEDGE_ENDPOINT')
+
+    def should_hedge(self, attempt: RenderAttempt) -> bool:
+        """True once the request has waited or rendered longer than the configured percentile"""
+        phase, elapsed = ('queue', attempt.queue_wait()) if attempt.started_at is None else ('render', attempt.render_time())
+        threshold = self.tracker.percentile(attempt.endpoint, phase, self.percentile, self.min_samples)
+        return threshold is not None and elapsed > threshold
+
+    def render(self, endpoint: str, arguments: Dict, label: str = 'render') -> Dict:
+        """Submit a render and return the result of whichever request finishes first"""
+        self.tracker.earn_hedge()
+        attempts: List[RenderAttempt] = [RenderAttempt(self.client, endpoint, arguments, label)]
+        logger.info(f"Submitted {label} to {endpoint} ({attempts[0].handle.request_id})")
+        may_hedge = self.enabled
+
+        winner = None
+        try:
+            while True:
+                for attempt in list(attempts):
+                    was_queued = attempt.started_at is None
+                    done = attempt.poll()
+                    if was_queued and attempt.started_at is not None:
+                        self.tracker.record(attempt.endpoint, 'queue', attempt.queue_wait())
+                    if not done:
+                        continue
+
+                    # Completed also covers failed requests, which only surface when fetching the result
+                    try:
+                        result = attempt.handle.get()
+                    except Exception as e:
+                        attempts.remove(attempt)
+                        if not attempts:
+                            raise
+                        logger.warning(f"{attempt.label} failed ({str(e)}), waiting on {attempts[0].label}")
+                        continue
+                    winner = attempt
+                    self.finish(attempt, attempts)
+                    return result
+
+                if may_hedge and self.should_hedge(attempts[0]):
+                    # At most one hedge per render
+                    may_hedge = False
+                    if self.tracker.spend_hedge():
+                        hedge_endpoint = self.hedge_endpoint or endpoint
+                        hedge = RenderAttempt(self.client, hedge_endpoint, arguments, f"{label} hedge")
+                        attempts.append(hedge)
+                        logger.warning(
+                            f"{label} passed p{self.percentile:g} latency on {endpoint}, "
+                            f"hedging on {hedge_endpoint} ({hedge.handle.request_id})"
+                        )
+                    else:
+                        logger.info(f"{label} is slow but the hedge budget is spent")
+
+                time.sleep(POLL_INTERVAL)
+        finally:
+            # Whatever ended the render (a result, a failed status call, an interrupt),
+            # no other request is left running and billing
+            for attempt in attempts:
+                if attempt is not winner:
+                    attempt.cancel()
+
+    def finish(self, winner: RenderAttempt, attempts: List[RenderAttempt]):
+        """Record latencies for a render whose result was fetched; render() cancels the losers"""
+        self.tracker.record(winner.endpoint, 'render', winner.render_time())
+        for attempt in attempts:
+            if attempt is winner:
+                continue
+            # A slower request submitted before the winner took at least this long; leaving it
+            # unsampled would drag the percentiles down and make hedging ever more eager
+            if attempt.submitted_at <= winner.submitted_at:
+                if attempt.started_at is None:
+                    self.tracker.record(attempt.endpoint, 'queue', attempt.queue_wait())
+                else:
+                    self.tracker.record(attempt.endpoint, 'render', attempt.render_time())
+        if len(attempts) > 1:
+            logger.info(f"{winner.label} finished first on {winner.endpoint}")
+
+
+# Shared by every render in the process so percentiles and budget are global
+latency_tracker = LatencyTracker(
+    os.getenv('RENDER_STATS_PATH', 'config/render_stats.json'),
+    float(os.getenv('RENDER_HEDGE_BUDGET', '0.1'))
+)
@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+Webhook completion for fal renders
+Submits Veo requests with a callback URL instead of holding a thread per render,
+keeps pending requests on disk and resumes the pipeline when fal calls back
+"""
+
+import os
+import json
+import hmac
+import time
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+import requests
+from loguru import logger
+from dotenv import load_dotenv
+from job_context import JobContext, client_config_from_token, client_pool
+from render_scheduler import VEO_ENDPOINT
+from scheduler import PIPELINES
+
+load_dotenv()
+
+
+class PendingRenderStore:
+    """Pending webhook jobs, persisted to JSON so a restart can pick them up again"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.jobs = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.jobs = json.load(f)
+        # Jobs saved before callbacks were buffered
+        for job in self.jobs.values():
+            job.setdefault('retired', [])
+            job.setdefault('early_callbacks', {})
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.jobs, f)
+        os.replace(tmp_path, self.path)
+
+
+class WebhookRenderCoordinator:
+    """Tracks webhook renders per job and runs download, QA, assembly and upload once all arrive"""
+
+    def __init__(self, base_url: str, store: PendingRenderStore, on_update: Callable[[str, Dict], None]):
+        self.base_url = base_url.rstrip('/')
+        self.queue_url = os.getenv('FAL_QUEUE_URL', 'https://queue.fal.run').rstrip('/')
+        self.poll_after = float(os.getenv('WEBHOOK_POLL_AFTER_SECONDS', '900'))
+        self.poll_interval = float(os.getenv('WEBHOOK_POLL_INTERVAL_SECONDS', '60'))
+        self.store = store
+        self.on_update = on_update
+        # API keys only live in memory; jobs resumed after a restart use the .env keys
+        self.contexts = {}
+        self.executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv('WEBHOOK_RESUME_WORKERS', '2')),
+            thread_name_prefix='render-resume'
+        )
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+
+    def context_for(self, job_id: str) -> JobContext:
+        return self.contexts.get(job_id) or JobContext.from_env()
+
+    def restore_context(self, job_id: str, job: Dict) -> JobContext:
+        """Context to finish a job with, refusing to fall back to the default YouTube channel"""
+        context = self.contexts.get(job_id)
+        if context:
+            return context
+
+        context = JobContext.from_env()
+        account = job.get('youtube_account')
+        if job['upload'] and account != context.youtube_account:
+            # The job's own account only survives a restart through its cached OAuth token
+            client_config = client_config_from_token(job.get('youtube_token_path'))
+            if client_config is None or client_config['installed']['client_id'] != account:
+                raise Exception(f"YouTube credentials for account {account} could not be restored "
+                                f"after a restart, not uploading to the default channel")
+            context = context.for_youtube_account(client_config)
+        return context
+
+    def submit(self, context: JobContext, job: Dict, index: int, arguments: Dict) -> Dict:
+        """Queue one Veo render on fal with this job's callback URL"""
+        webhook_url = f"{self.base_url}/api/fal-webhook/{job['job_id']}/{job['token']}"
+        response = client_pool.fal_queue(context).post(
+            f"{self.queue_url}/{VEO_ENDPOINT}",
+            params={'fal_webhook': webhook_url},
+            json=arguments
+        )
+        response.raise_for_status()
+        data = response.json()
+        logger.info(f"Submitted render {index + 1} for {job['job_id']} ({data['request_id']})")
+
+        return {
+            'index': index,
+            'request_id': data['request_id'],
+            'status_url': data.get('status_url'),
+            'response_url': data.get('response_url'),
+            'cancel_url': data.get('cancel_url'),
+            'status': 'pending',
+            'result': None,
+            'path': None,
+            'submitted_at': time.time()
+        }
+
+    def record_render(self, job: Dict, render: Dict, context: JobContext, replaces: Optional[Dict] = None) -> bool:
+        """Add a submitted render to its job and apply any callback that beat it here
+
+        Returns False, cancelling the render, if the job failed while it was being submitted.
+        """
+        with self._lock:
+            active = self.store.jobs.get(job['job_id']) is job
+            if active:
+                if replaces is None:
+                    job['renders'].append(render)
+                else:
+                    job['renders'] = [render if r is replaces else r for r in job['renders']]
+                    job['retired'].append(replaces['request_id'])
+                early = job['early_callbacks'].pop(render['request_id'], None)
+                self.store.save()
+
+        if not active:
+            self.cancel_pending({'job_id': job['job_id'], 'renders': [render]}, context)
+            return False
+        if early is not None:
+            self.apply_callback(job['job_id'], render['request_id'], early)
+        return True
+
+    def start(self, job_id: str, pipeline: str, automation, script_data: Dict,
+              topic: Optional[str] = None, topic_data: Optional[Dict] = None, upload: bool = False):
+        """Submit every render for a script and return without waiting for them"""
+        render_requests = automation.render_requests(script_data)
+        job = {
+            'job_id': job_id,
+            'token': secrets.token_urlsafe(16),
+            'pipeline': pipeline,
+            'topic': topic or (topic_data or {}).get('topic'),
+            'topic_data': topic_data,
+            'script_data': script_data,
+            'upload': upload,
+            # Which account to upload to, without any secrets; see restore_context()
+            'youtube_account': automation.context.youtube_account if upload else None,
+            'youtube_token_path': automation.context.youtube_token_path if upload else None,
+            'expected': len(render_requests),
+            'renders': [],
+            'retired': [],
+            'early_callbacks': {},
+            'attempts': 0,
+            'resuming': False,
+            'created_at': datetime.now().isoformat()
+        }
+
+        with self._lock:
+            self.contexts[job_id] = automation.context
+            self.store.jobs[job_id] = job
+            self.store.save()
+
+        # Reported before submitting, as callbacks can finish the job before the loop below ends
+        self.on_update(job_id, {'progress': f"Waiting for {len(render_requests)} Veo video render(s)..."})
+        try:
+            for index, arguments in enumerate(render_requests):
+                render = self.submit(automation.context, job, index, arguments)
+                if not self.record_render(job, render, automation.context):
+                    return
+        except Exception:
+            with self._lock:
+                self.store.jobs.pop(job_id, None)
+                self.contexts.pop(job_id, None)
+                self.store.save()
+            self.cancel_pending(job, automation.context)
+            raise
+
+    def handle_webhook(self, job_id: str, token: str, body: Dict) -> bool:
+        """Apply a fal callback; returns False if the job/token pair is unknown"""
+        request_id = body.get('request_id') or body.get('gateway_request_id')
+        with self._lock:
+            job = self.store.jobs.get(job_id)
+            if not job or not hmac.compare_digest(job['token'], token):
+                return False
+            if request_id in job['retired']:
+                # Callback for a render that was already replaced
+                return True
+            if not any(r['request_id'] == request_id for r in job['renders']):
+                # fal can call back before submit() has returned; record_render() applies it
+                job['early_callbacks'][request_id] = body
+                self.store.save()
+                return True
+
+        self.apply_callback(job_id, request_id, body)
+        return True
+
+    def apply_callback(self, job_id: str, request_id: str, body: Dict):
+        """Complete or fail the render a callback belongs to"""
+        if body.get('status') == 'OK':
+            self.complete_render(job_id, request_id, body.get('payload') or {})
+            return
+
+        with self._lock:
+            job = self.store.jobs.get(job_id)
+            render = job and next((r for r in job['renders'] if r['request_id'] == request_id), None)
+            if not render or render['status'] != 'pending':
+                return
+            render['status'] = 'failed'
+        error = body.get('error') or body.get('payload') or 'unknown error'
+        self.fail_job(job_id, f"Veo render {request_id} failed: {error}")
+
+    def ready(self, job: Dict) -> bool:
+        return (not job['resuming']
+                and len(job['renders']) == job['expected']
+                and all(render['status'] == 'done' for render in job['renders']))
+
+    def complete_render(self, job_id: str, request_id: str, result: Dict):
+        """Record a finished render and resume the job once all of its renders are in"""
+        with self._lock:
+            job = self.store.jobs.get(job_id)
+            if not job:
+                return
+            render = next((r for r in job['renders'] if r['request_id'] == request_id), None)
+            if render is None or render['status'] != 'pending':
+                # Repeated callback
+                return
+
+            render['status'] = 'done'
+            render['result'] = result
+            ready = self.ready(job)
+            if ready:
+                job['resuming'] = True
+            self.store.save()
+
+        if ready:
+            self.executor.submit(self.resume, job_id)
+
+    def cancel_pending(self, job: Dict, context: JobContext):
+        """Cancel a job's renders that are still queued or running so they stop billing"""
+        session = client_pool.fal_queue(context)
+        for render in job['renders']:
+            if render['status'] != 'pending':
+                continue
+            cancel_url = render.get('cancel_url') or f"{self.queue_url}/{VEO_ENDPOINT}/requests/{render['request_id']}/cancel"
+            try:
+                session.put(cancel_url)
+                logger.info(f"Cancelled render {render['request_id']} for {job['job_id']}")
+            except requests.RequestException as e:
+                logger.warning(f"Could not cancel render {render['request_id']}: {str(e)}")
+
+    def fail_job(self, job_id: str, error: str):
+        """Drop a job, cancel its outstanding renders and report the failure"""
+        with self._lock:
+            job = self.store.jobs.pop(job_id, None)
+            context = self.contexts.pop(job_id, None) or JobContext.from_env()
+            self.store.save()
+        if not job:
+            return
+
+        logger.error(f"Error in job {job_id}: {error}")
+        self.on_update(job_id, {'status': 'error', 'progress': 'Failed to create video', 'error': error})
+
+        def clean_up():
+            self.cancel_pending(job, context)
+            if job['topic_data']:
+                automation = PIPELINES[job['pipeline']](context)
+                automation.topics_sheet.update_cell(job['topic_data']['row'], 2, 'Error')
+        self.executor.submit(clean_up)
+
+    def resume(self, job_id: str):
+        """Download, check, assemble and publish a job whose renders have all arrived"""
+        with self._lock:
+            job = self.store.jobs.get(job_id)
+        if not job:
+            return
+
+        try:
+            automation = PIPELINES[job['pipeline']](self.restore_context(job_id, job))
+            if job['upload'] and not automation.youtube:
+                raise Exception(f"YouTube account {job['youtube_account']} is not available for upload")
+            script_data = job['script_data']
+
+            self.on_update(job_id, {'progress': 'Downloading video renders...'})
+            renders = sorted(job['renders'], key=lambda r: r['index'])
+            for render in renders:
+                if not render['path'] or not os.path.exists(render['path']):
+                    render['path'] = automation.download_render(render['result'], render['index'])
+            with self._lock:
+                self.store.save()
+
+            paths = [render['path'] for render in renders]
+            failed = automation.check_renders(paths)
+            if failed:
+                self.rerender(job, automation, renders, failed)
+                return
+
+            video_path = automation.assemble(paths, script_data)
+
+            video_url = None
+            if job['upload']:
+                self.on_update(job_id, {'progress': 'Uploading to YouTube...'})
+                video_url = automation.upload_to_youtube(video_path, script_data)
+                if job['topic_data']:
+                    automation.update_sheets(job['topic_data'], video_url, script_data)
+                automation.publish_variants(job['topic_data'], video_path, script_data)
+
+            with self._lock:
+                self.store.jobs.pop(job_id, None)
+                self.contexts.pop(job_id, None)
+                self.store.save()
+
+            logger.success(f"Webhook job {job_id} finished: {video_url or video_path}")
+            self.on_update(job_id, {
+                'status': 'completed',
+                'topic': job['topic'],
+                'video_title': script_data['title'],
+                'video_path': video_path,
+                'video_url': video_url
+            })
+
+        except Exception as e:
+            self.fail_job(job_id, str(e))
+
+    def rerender(self, job: Dict, automation, renders: List[Dict], failed: Dict[int, List[str]]):
+        """Resubmit only the renders that failed QA"""
+        summary = '; '.join(f"render {idx + 1}: {', '.join(issues)}" for idx, issues in sorted(failed.items()))
+        if job['attempts'] >= automation.qa.max_retries:
+            raise Exception(f"Render QA failed: {summary}")
+
+        logger.warning(f"Re-rendering for {job['job_id']} after QA failure: {summary}")
+        arguments = automation.render_requests(job['script_data'])
+
+        # Block readiness until every replacement has been submitted
+        with self._lock:
+            job['attempts'] += 1
+            for render in renders:
+                if render['index'] in failed:
+                    render['status'] = 'resubmitting'
+            job['resuming'] = False
+            self.store.save()
+
+        for render in renders:
+            if render['index'] not in failed:
+                continue
+            if os.path.exists(render['path']):
+                os.remove(render['path'])
+            replacement = self.submit(automation.context, job, render['index'], arguments[render['index']])
+            if not self.record_render(job, replacement, automation.context, replaces=render):
+                return
+
+        self.on_update(job['job_id'], {'progress': f"Re-rendering {len(failed)} video render(s) that failed QA..."})
+
+    def poll_pending(self):
+        """Fallback for missed callbacks: ask fal about renders that have waited too long"""
+        now = time.time()
+        with self._lock:
+            stale = [
+                (job_id, dict(render))
+                for job_id, job in self.store.jobs.items()
+                for render in job['renders']
+                if render['status'] == 'pending' and now - render['submitted_at'] > self.poll_after
+            ]
+
+        for job_id, render in stale:
+            session = client_pool.fal_queue(self.context_for(job_id))
+            try:
+                status = session.get(render['status_url']).json()
+                if status.get('status') != 'COMPLETED':
+                    continue
+
+                logger.warning(f"Callback missed for {render['request_id']}, fetched by polling")
+                response = session.get(render['response_url'])
+                if not response.ok:
+                    self.fail_job(job_id, f"Veo render {render['request_id']} failed: {response.text}")
+                    continue
+                self.complete_render(job_id, render['request_id'], response.json())
+            except requests.RequestException as e:
+                logger.warning(f"Polling {render['request_id']} failed: {str(e)}")
+
+    def recover(self):
+        """Restart jobs whose renders all arrived before the process stopped"""
+        with self._lock:
+            recovered = []
+            for job_id, job in self.store.jobs.items():
+                job['resuming'] = False
+                if self.ready(job):
+                    job['resuming'] = True
+                    recovered.append(job_id)
+            self.store.save()
+
+        for job_id in recovered:
+            logger.info(f"Resuming webhook job {job_id} after restart")
+            self.executor.submit(self.resume, job_id)
+
+    def start_poller(self):
+        """Recover interrupted jobs and poll for missed callbacks in the background"""
+        self.recover()
+
+        def poll_loop():
+            while not self._stop.wait(self.poll_interval):
+                try:
+                    self.poll_pending()
+                except Exception as e:
+                    logger.error(f"Render polling failed: {str(e)}")
+
+        threading.Thread(target=poll_loop, name='render-poller', daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
@@ -5,48 +5,191 @@ Runs video generation at specified times
 """
 
 import os
-import schedule
-import time
-from datetime import datetime
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
 from loguru import logger
 from dotenv import load_dotenv
 from video_automation import VideoAutomation
+from video_automation_multi_clip import MultiClipVideoAutomation
 
 load_dotenv()
 
-# Configure logging
-logger.add("logs/scheduler_{time}.log", rotation="1 day", retention="7 days")
+# Pipeline types that can be attached to a slot, e.g. "14:00@multi" (webhook jobs use the same names)
+PIPELINES = {
+    'single': VideoAutomation,
+    'multi': MultiClipVideoAutomation
+}
+
+# Upper bound on a single sleep so wall-clock jumps (suspend, DST) are noticed
+MAX_SLEEP_SECONDS = 300
+
+
+class Slot(NamedTuple):
+    hour: int
+    minute: int
+    pipeline: str
+
+    @property
+    def key(self) -> str:
+        return f"{self.hour:02d}:{self.minute:02d}@{self.pipeline}"
+
+
+def parse_slots(spec: str) -> List[Slot]:
+    """Parse VIDEO_SCHEDULE_TIMES, e.g. "07:00,14:00@multi,19:00" """
+    slots = []
+    for entry in spec.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        time_str, _, pipeline = entry.partition('@')
+        pipeline = pipeline.strip() or 'single'
+        if pipeline not in PIPELINES:
+            raise ValueError(f"Unknown pipeline '{pipeline}' in schedule entry '{entry}'")
+        # Checked here so a typo fails at startup instead of killing the running loop
+        try:
+            hour, minute = (int(part) for part in time_str.strip().split(':'))
+        except ValueError:
+            hour, minute = -1, -1
+        if not (0 <= hour < 24 and 0 <= minute < 60):
+            raise ValueError(f"Invalid time '{time_str.strip()}' in schedule entry '{entry}', expected HH:MM")
+        slots.append(Slot(hour, minute, pipeline))
+    return slots
+
+
+class VideoScheduler:
+    """Sleeps until the next slot deadline and dispatches runs to a worker pool"""
+
+    def __init__(self, slots: List[Slot]):
+        self.slots = slots
+        self.catchup_window = timedelta(minutes=int(os.getenv('SCHEDULE_CATCHUP_MINUTES', '60')))
+        self.state_path = os.getenv('SCHEDULER_STATE_PATH', 'config/scheduler_state.json')
+        self.executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv('SCHEDULER_MAX_WORKERS', '2')),
+            thread_name_prefix='video-slot'
+        )
+        self._stop = threading.Event()
+        self._claim_lock = threading.Lock()
+        self._active_rows = set()
+        self.last_run = self.load_state()
+
+    def load_state(self) -> Dict[str, datetime]:
+        """Load the last dispatched occurrence of each slot"""
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path, 'r') as f:
+            return {key: datetime.fromisoformat(value) for key, value in json.load(f).items()}
+
+    def save_state(self):
+        """Persist last dispatched occurrences so missed slots survive restarts"""
+        os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({key: value.isoformat() for key, value in self.last_run.items()}, f)
+        os.replace(tmp_path, self.state_path)
+
+    @staticmethod
+    def latest_occurrence(slot: Slot, now: datetime) -> datetime:
+        """Most recent time the slot fired at or before now"""
+        occurrence = now.replace(hour=slot.hour, minute=slot.minute, second=0, microsecond=0)
+        if occurrence > now:
+            occurrence -= timedelta(days=1)
+        return occurrence
+
+    def next_deadline(self, now: datetime) -> datetime:
+        """Earliest upcoming slot time after now"""
+        return min(self.latest_occurrence(slot, now) + timedelta(days=1) for slot in self.slots)
+
+    def due_slots(self, now: datetime) -> List[Tuple[Slot, datetime]]:
+        """Slots whose latest occurrence has not been dispatched yet"""
+        due = []
+        for slot in self.slots:
+            occurrence = self.latest_occurrence(slot, now)
+            last = self.last_run.get(slot.key)
+            if last is None:
+                # First time we see this slot: nothing was missed yet
+                self.last_run[slot.key] = occurrence
+                continue
+            if last >= occurrence:
+                continue
+            self.last_run[slot.key] = occurrence
+            if now - occurrence > self.catchup_window:
+                logger.warning(f"Skipping missed slot {slot.key} at {occurrence} (outside catch-up window)")
+                continue
+            if now - occurrence > timedelta(seconds=MAX_SLEEP_SECONDS):
+                logger.info(f"Catching up missed slot {slot.key} at {occurrence}")
+            due.append((slot, occurrence))
+        return due
+
+    def claim_topic(self, automation) -> Optional[Dict]:
+        """Reserve the next topic so concurrent slots never process the same row"""
+        with self._claim_lock:
+            topic_data = automation.get_next_topic(exclude_rows=self._active_rows)
+            if topic_data:
+                self._active_rows.add(topic_data['row'])
+            return topic_data
+
+    def run_slot(self, slot: Slot, occurrence: datetime):
+        """Worker entry point for one slot occurrence"""
+        logger.info(f"Starting {slot.pipeline} video generation for slot {slot.key} ({occurrence})")
+        topic_data = None
+        try:
+            automation = PIPELINES[slot.pipeline]()
+            topic_data = self.claim_topic(automation)
+            if not topic_data:
+                logger.info(f"No unclaimed topics for slot {slot.key}")
+                return
+            automation.process_video(topic_data)
+        except Exception as e:
+            logger.error(f"Failed to generate video for slot {slot.key}: {str(e)}")
+        finally:
+            if topic_data:
+                with self._claim_lock:
+                    self._active_rows.discard(topic_data['row'])
+
+    def run(self):
+        """Main loop: dispatch due slots, then sleep until the next deadline"""
+        for slot in self.slots:
+            logger.info(f"Scheduled {slot.pipeline} video generation at {slot.hour:02d}:{slot.minute:02d}")
+        logger.info("Scheduler started. Waiting for scheduled times...")
+
+        try:
+            while not self._stop.is_set():
+                now = datetime.now()
+                due = self.due_slots(now)
+                self.save_state()
+                for slot, occurrence in due:
+                    self.executor.submit(self.run_slot, slot, occurrence)
+
+                delay = (self.next_deadline(now) - datetime.now()).total_seconds()
+                self._stop.wait(min(max(delay, 0), MAX_SLEEP_SECONDS))
+        finally:
+            self.executor.shutdown(wait=True)
+
+    def stop(self):
+        """Stop the loop after in-flight runs finish"""
+        self._stop.set()
+
+
+def main():
+    """Start the scheduler"""
+    # Configure logging here so importing PIPELINES elsewhere doesn't open a scheduler log
+    logger.add("logs/scheduler_{time}.log", rotation="1 day", retention="7 days")
+
+    slots = parse_slots(os.getenv('VIDEO_SCHEDULE_TIMES', '07:00,14:00,19:00'))
+    scheduler = VideoScheduler(slots)
 
-def run_video_generation():
-    """Run the video generation process"""
-    logger.info(f"Starting video generation at {datetime.now()}")
-    try:
-        automation = VideoAutomation()
-        automation.process_video()
-    except Exception as e:
-        logger.error(f"Failed to generate video: {str(e)}")
-
-def setup_schedule():
-    """Set up the video generation schedule"""
-    schedule_times = os.getenv('VIDEO_SCHEDULE_TIMES', '07:00,14:00,19:00').split(',')
-    
-    for time_str in schedule_times:
-        schedule.every().day.at(time_str.strip()).do(run_video_generation)
-        logger.info(f"Scheduled video generation at {time_str.strip()}")
-    
-    logger.info("Scheduler started. Waiting for scheduled times...")
-    
     # Run immediately on start for testing
     if os.getenv('RUN_ON_START', 'false').lower() == 'true':
-        run_video_generation()
+        now = datetime.now()
+        scheduler.executor.submit(scheduler.run_slot, Slot(now.hour, now.minute, 'single'), now)
 
-def main():
-    """Main scheduler loop"""
-    setup_schedule()
-    
-    while True:
-        schedule.run_pending()
-        time.sleep(60)  # Check every minute
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        scheduler.stop()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -202,6 +202,12 @@ function showSuccess(job) {
         link.href = job.video_url;
         link.style.display = 'inline-block';
     }
+    
+    if (job.preview_url) {
+        const preview = document.getElementById('resultPreview');
+        preview.src = job.preview_url;
+        preview.style.display = 'block';
+    }
 }
 
 function showError(message) {
@@ -212,11 +218,14 @@ function showError(message) {
     document.getElementById('resultTitle').textContent = 'Error';
     document.getElementById('resultMessage').textContent = message;
     document.getElementById('resultLink').style.display = 'none';
+    document.getElementById('resultPreview').style.display = 'none';
 }
 
 function resetForm() {
     document.getElementById('quickTopic').value = '';
     document.getElementById('resultSection').style.display = 'none';
+    document.getElementById('resultPreview').removeAttribute('src');
+    document.getElementById('resultPreview').style.display = 'none';
     document.querySelector('.result-icon i').className = 'bi bi-check-circle-fill text-success';
 }
 
@@ -250,6 +259,10 @@ async function loadRecentVideos() {
                             `<a href="${video.video_url || video['Video URL']}" target="_blank" class="btn btn-sm btn-outline-primary">
                                 <i class="bi bi-play-circle"></i> Watch
                             </a>` : 
+                            video.local_url ?
+                            `<a href="${video.local_url}" target="_blank" class="btn btn-sm btn-outline-secondary">
+                                <i class="bi bi-play-circle"></i> Play Local
+                            </a>` :
                             '<span class="badge bg-secondary">Local Only</span>'
                         }
                     </div>
@@ -42,7 +42,7 @@ def test_imports():
         ('loguru', 'loguru'),
         ('fal_client', 'fal-client'),
         ('requests', 'requests'),
-        ('schedule', 'schedule')
+        ('numpy', 'numpy')
     ]
     
     missing = []
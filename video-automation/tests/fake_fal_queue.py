@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Fake fal queue
+Minimal stand-in for fal's queue REST API so webhook mode can be exercised
+without spending credits: point FAL_QUEUE_URL at it.
+
+    python tests/fake_fal_queue.py --port 8765 --video sample.mp4
+"""
+
+import uuid
+import argparse
+import threading
+import requests
+from flask import Flask, jsonify, request, abort
+from werkzeug.serving import make_server
+
+
+def create_app(video_bytes: bytes, callback_first: bool = True) -> Flask:
+    """Queue app that completes every request at once and calls its webhook
+
+    With callback_first the webhook is delivered before the submit response, like a
+    cached result, which is the ordering that catches callbacks racing the submitter.
+    """
+    app = Flask(__name__)
+    app.requests = {}
+    app.cancelled = []
+    app.fail_prompts = set()
+    app.callback_first = callback_first
+
+    def deliver(request_id: str):
+        entry = app.requests[request_id]
+        if entry['failed']:
+            body = {'request_id': request_id, 'status': 'ERROR', 'error': 'render failed'}
+        else:
+            body = {'request_id': request_id, 'status': 'OK', 'payload': entry['result']}
+        requests.post(entry['webhook'], json=body, timeout=10)
+
+    @app.route('/files/<request_id>.mp4')
+    def video_file(request_id):
+        return video_bytes, 200, {'Content-Type': 'video/mp4'}
+
+    @app.route('/<path:endpoint>/requests/<request_id>/status')
+    def status(endpoint, request_id):
+        return jsonify({'status': 'COMPLETED'})
+
+    @app.route('/<path:endpoint>/requests/<request_id>/cancel', methods=['PUT'])
+    def cancel(endpoint, request_id):
+        app.cancelled.append(request_id)
+        return jsonify({'status': 'CANCELLATION_REQUESTED'})
+
+    @app.route('/<path:endpoint>/requests/<request_id>')
+    def response(endpoint, request_id):
+        entry = app.requests.get(request_id) or abort(404)
+        return jsonify(entry['result'])
+
+    @app.route('/<path:endpoint>', methods=['POST'])
+    def submit(endpoint):
+        request_id = uuid.uuid4().hex
+        base = f"{request.host_url.rstrip('/')}/{endpoint}/requests/{request_id}"
+        app.requests[request_id] = {
+            'webhook': request.args['fal_webhook'],
+            'arguments': request.get_json(),
+            'failed': request.get_json().get('prompt') in app.fail_prompts,
+            'result': {'video': {'url': f"{request.host_url}files/{request_id}.mp4"}}
+        }
+
+        if app.callback_first:
+            deliver(request_id)
+        else:
+            threading.Thread(target=deliver, args=(request_id,), daemon=True).start()
+
+        return jsonify({
+            'request_id': request_id,
+            'status_url': f"{base}/status",
+            'response_url': base,
+            'cancel_url': f"{base}/cancel"
+        })
+
+    return app
+
+
+class BackgroundServer:
+    """Serves a WSGI app on a free local port from a daemon thread"""
+
+    def __init__(self, app, port: int = 0):
+        self.server = make_server('127.0.0.1', port, app, threaded=True)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake fal queue for webhook mode')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--video', required=True, help='MP4 returned as every render')
+    args = parser.parse_args()
+
+    with open(args.video, 'rb') as f:
+        app = create_app(f.read(), callback_first=False)
+    print(f"Set FAL_QUEUE_URL=http://127.0.0.1:{args.port}")
+    app.run(port=args.port, threaded=True)
+
+if __name__ == "__main__":
+    main()
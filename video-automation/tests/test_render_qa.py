@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Render QA checks on synthetic luma arrays, no ffmpeg needed
+"""
+
+import os
+import sys
+import unittest
+from unittest import mock
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from render_qa import (FRAME_SIZE, SAMPLE_FPS, RenderQA, black_ratio, duplicate_pairs,
+                       frozen_seconds, longest_run)
+
+PIXELS = FRAME_SIZE * FRAME_SIZE
+rng = np.random.default_rng(0)
+
+
+def moving_scene(seconds: float, low: float = 0, high: float = 255) -> np.ndarray:
+    """Frames of independent noise, so every frame differs from the last"""
+    return rng.uniform(low, high, size=(int(seconds * SAMPLE_FPS), PIXELS)).astype(np.float32)
+
+
+def black_hole_frame() -> np.ndarray:
+    """Night-sky style frame: 90% of pixels near 10 and a bright accretion disk"""
+    frame = np.full(PIXELS, 10.0, dtype=np.float32)
+    frame[:PIXELS // 10] = 120.0
+    return frame
+
+
+class LongestRunTest(unittest.TestCase):
+
+    def test_longest_run(self):
+        self.assertEqual(longest_run(np.array([], dtype=bool)), 0)
+        self.assertEqual(longest_run(np.array([False, False])), 0)
+        self.assertEqual(longest_run(np.array([True, True, False, True, True, True, False])), 3)
+        self.assertEqual(longest_run(np.array([True] * 5)), 5)
+
+
+class BlackCheckTest(unittest.TestCase):
+
+    def test_fully_dark_frames_are_black(self):
+        self.assertEqual(black_ratio(np.full((8, PIXELS), 5.0)), 1.0)
+
+    def test_dark_footage_with_a_bright_subject_is_not_black(self):
+        frames = np.stack([black_hole_frame()] * 8)
+        # Mean luma is below the old whole-frame cut-off, which flagged it
+        self.assertLess(frames.mean(), 0.1 * 255)
+        self.assertEqual(black_ratio(frames), 0.0)
+
+    def test_counts_only_the_black_frames(self):
+        frames = np.concatenate([np.full((3, PIXELS), 2.0), moving_scene(0.25)])
+        self.assertAlmostEqual(black_ratio(frames), 0.75)
+
+
+class FrozenCheckTest(unittest.TestCase):
+
+    def test_repeated_frame_is_frozen(self):
+        frames = np.concatenate([moving_scene(2), np.repeat(moving_scene(0.25), 5 * SAMPLE_FPS, axis=0)])
+        self.assertAlmostEqual(frozen_seconds(frames), (5 * SAMPLE_FPS - 1) / SAMPLE_FPS)
+
+    def test_moving_scene_is_not_frozen(self):
+        self.assertEqual(frozen_seconds(moving_scene(8)), 0.0)
+        self.assertEqual(frozen_seconds(moving_scene(0.25)), 0.0)
+
+
+class DuplicateCheckTest(unittest.TestCase):
+
+    def test_same_shot_is_a_duplicate(self):
+        layout = rng.uniform(0, 255, PIXELS)
+        signatures = np.stack([layout, rng.uniform(0, 255, PIXELS), layout + rng.normal(0, 3, PIXELS)])
+        self.assertEqual(duplicate_pairs(signatures), [(2, 0)])
+
+    def test_different_dark_scenes_are_not_duplicates(self):
+        # Both average close to black, which an absolute difference called the same shot
+        signatures = np.stack([rng.uniform(5, 11, PIXELS), rng.uniform(5, 11, PIXELS)])
+        self.assertLess(np.abs(signatures[0] - signatures[1]).mean(), 4.0)
+        self.assertEqual(duplicate_pairs(signatures), [])
+
+    def test_flat_signatures_are_not_compared(self):
+        self.assertEqual(duplicate_pairs(np.stack([np.full(PIXELS, 3.0), np.full(PIXELS, 3.0)])), [])
+
+
+class CheckScenesTest(unittest.TestCase):
+
+    def test_scene_report_with_dark_footage(self):
+        night = np.stack([black_hole_frame() + rng.normal(0, 4, PIXELS) for _ in range(8 * SAMPLE_FPS)])
+        clips = {
+            'night.mp4': night,
+            'other_night.mp4': np.roll(night, PIXELS // 2, axis=1) * 0.8,
+            'black.mp4': np.full((8 * SAMPLE_FPS, PIXELS), 1.0),
+            'repeat.mp4': night + rng.normal(0, 4, night.shape),
+        }
+        qa = RenderQA()
+        qa.enabled = True
+        info = {'width': 1280, 'height': 720, 'duration': 8.0}
+        with mock.patch.object(qa, 'probe', return_value=info), \
+                mock.patch.object(qa, 'decode_frames',
+                                  side_effect=lambda path: clips[path].reshape(-1, FRAME_SIZE, FRAME_SIZE)):
+            failed = qa.check_scenes(list(clips), '16:9')
+
+        self.assertEqual(sorted(failed), [2, 3])
+        self.assertIn('100% black frames', failed[2])
+        self.assertEqual(failed[3], ['duplicate of scene 1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
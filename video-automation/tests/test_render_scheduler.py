@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Hedged rendering against a fake fal client: hedge, fallback, cancel and budget
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import fal_client
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import render_scheduler
+from render_scheduler import LatencyTracker, RenderScheduler
+
+QUEUED = fal_client.Queued(position=0)
+RUNNING = fal_client.InProgress(logs=[])
+COMPLETED = fal_client.Completed(logs=[], metrics={})
+
+
+class FakeHandle:
+    """Plays back a list of statuses, repeating the last one"""
+
+    def __init__(self, request_id, statuses, result=None, error=None):
+        self.request_id = request_id
+        self.statuses = list(statuses)
+        self.result = result
+        self.error = error
+        self.cancelled = False
+
+    def status(self, with_logs=False):
+        status = self.statuses.pop(0) if len(self.statuses) > 1 else self.statuses[0]
+        if isinstance(status, Exception):
+            raise status
+        return status
+
+    def get(self):
+        if self.error:
+            raise self.error
+        return self.result
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeClient:
+    """Hands out the scripted handles in submit order"""
+
+    def __init__(self, *handles):
+        self.pending = list(handles)
+        self.submitted = []
+
+    def submit(self, endpoint, arguments):
+        handle = self.pending.pop(0)
+        self.submitted.append((endpoint, handle))
+        return handle
+
+
+class RenderSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        poll = mock.patch.object(render_scheduler, 'POLL_INTERVAL', 0.001)
+        poll.start()
+        self.addCleanup(poll.stop)
+
+    def make_scheduler(self, client, budget=1.0, history=True) -> RenderScheduler:
+        self.tracker = LatencyTracker(os.path.join(self.tmp, 'stats.json'), budget)
+        if history:
+            # Every past render was instant, so anything still pending counts as slow
+            for phase in ('queue', 'render'):
+                self.tracker.record('veo', phase, 0.0)
+        scheduler = RenderScheduler(client, self.tracker)
+        scheduler.enabled = True
+        scheduler.min_samples = 1
+        scheduler.hedge_endpoint = None
+        return scheduler
+
+    def samples(self, phase):
+        return list(self.tracker._samples.get(f"veo:{phase}", []))
+
+    def test_fast_render_is_not_hedged(self):
+        primary = FakeHandle('primary', [RUNNING, COMPLETED], result={'video': 'primary'})
+        client = FakeClient(primary)
+
+        result = self.make_scheduler(client, history=False).render('veo', {})
+
+        self.assertEqual(result, {'video': 'primary'})
+        self.assertEqual(len(client.submitted), 1)
+        self.assertFalse(primary.cancelled)
+
+    def test_slow_render_is_hedged_and_the_loser_cancelled(self):
+        primary = FakeHandle('primary', [RUNNING], result={'video': 'primary'})
+        hedge = FakeHandle('hedge', [RUNNING, COMPLETED], result={'video': 'hedge'})
+        client = FakeClient(primary, hedge)
+
+        result = self.make_scheduler(client).render('veo', {})
+
+        self.assertEqual(result, {'video': 'hedge'})
+        self.assertTrue(primary.cancelled)
+        self.assertFalse(hedge.cancelled)
+        # Winner's time plus the cancelled primary's time as a lower bound
+        self.assertEqual(len(self.samples('render')), 3)
+
+    def test_spent_budget_means_no_hedge(self):
+        primary = FakeHandle('primary', [QUEUED, RUNNING, RUNNING, COMPLETED], result={'video': 'primary'})
+        client = FakeClient(primary)
+
+        result = self.make_scheduler(client, budget=0.0).render('veo', {})
+
+        self.assertEqual(result, {'video': 'primary'})
+        self.assertEqual(len(client.submitted), 1)
+
+    def test_failed_result_falls_back_to_the_other_attempt(self):
+        primary = FakeHandle('primary', [RUNNING, RUNNING, COMPLETED], error=RuntimeError('render failed'))
+        hedge = FakeHandle('hedge', [RUNNING, RUNNING, RUNNING, COMPLETED], result={'video': 'hedge'})
+        client = FakeClient(primary, hedge)
+
+        result = self.make_scheduler(client).render('veo', {})
+
+        self.assertEqual(result, {'video': 'hedge'})
+        self.assertFalse(primary.cancelled)
+
+    def test_last_failed_attempt_raises(self):
+        primary = FakeHandle('primary', [COMPLETED], error=RuntimeError('render failed'))
+        client = FakeClient(primary)
+
+        with self.assertRaisesRegex(RuntimeError, 'render failed'):
+            self.make_scheduler(client, history=False).render('veo', {})
+
+    def test_status_error_cancels_every_attempt(self):
+        primary = FakeHandle('primary', [RUNNING, RUNNING, ConnectionError('status unavailable')])
+        hedge = FakeHandle('hedge', [RUNNING])
+        client = FakeClient(primary, hedge)
+
+        with self.assertRaises(ConnectionError):
+            self.make_scheduler(client).render('veo', {})
+
+        self.assertEqual(len(client.submitted), 2)
+        self.assertTrue(primary.cancelled)
+        self.assertTrue(hedge.cancelled)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Webhook render flow against the fake fal queue: submit -> callback -> resume
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from flask import Flask, request, jsonify
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+import render_webhooks
+from job_context import JobContext
+from render_webhooks import PendingRenderStore, WebhookRenderCoordinator
+from fake_fal_queue import BackgroundServer, create_app
+
+VIDEO_BYTES = b'fake mp4 bytes'
+
+
+class FakeQA:
+    max_retries = 1
+
+
+class FakePipeline:
+    """Two renders per job; records what the coordinator asks of it"""
+
+    output_dir = None
+    failing_qa = set()
+
+    def __init__(self, context):
+        self.context = context
+        self.youtube = None
+        self.qa = FakeQA()
+
+    def render_requests(self, script_data):
+        return [{'prompt': scene} for scene in script_data['scenes']]
+
+    def download_render(self, result, index):
+        path = os.path.join(self.output_dir, f"render_{index}_{os.urandom(4).hex()}.mp4")
+        with open(path, 'wb') as f:
+            f.write(requests.get(result['video']['url']).content)
+        return path
+
+    def check_renders(self, paths):
+        failing = {idx: ['frozen'] for idx in range(len(paths)) if idx in self.failing_qa}
+        FakePipeline.failing_qa = set()
+        return failing
+
+    def assemble(self, paths, script_data):
+        return paths[0]
+
+
+class WebhookFlowTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        FakePipeline.output_dir = self.tmp
+        FakePipeline.failing_qa = set()
+
+        self.queue = create_app(VIDEO_BYTES, callback_first=True)
+        self.queue_server = BackgroundServer(self.queue).__enter__()
+
+        self.updates = {}
+        self.finished = threading.Event()
+        receiver = Flask('receiver')
+
+        @receiver.route('/api/fal-webhook/<job_id>/<token>', methods=['POST'])
+        def fal_webhook(job_id, token):
+            if not self.coordinator.handle_webhook(job_id, token, request.get_json()):
+                return jsonify({'success': False}), 404
+            return jsonify({'success': True})
+
+        self.receiver_server = BackgroundServer(receiver).__enter__()
+
+        env = mock.patch.dict(os.environ, {'FAL_QUEUE_URL': self.queue_server.url})
+        env.start()
+        self.addCleanup(env.stop)
+        pipelines = mock.patch.dict(render_webhooks.PIPELINES, {'fake': FakePipeline})
+        pipelines.start()
+        self.addCleanup(pipelines.stop)
+
+        self.store = PendingRenderStore(os.path.join(self.tmp, 'pending.json'))
+        self.coordinator = WebhookRenderCoordinator(self.receiver_server.url, self.store, self.on_update)
+        self.context = JobContext(grok_api_key='grok', fal_key='fal')
+
+    def tearDown(self):
+        self.coordinator.executor.shutdown(wait=True)
+        self.queue_server.__exit__()
+        self.receiver_server.__exit__()
+        shutil.rmtree(self.tmp)
+
+    def on_update(self, job_id, fields):
+        self.updates.setdefault(job_id, []).append(fields)
+        if fields.get('status') in ('completed', 'error'):
+            self.finished.set()
+
+    def start_job(self, scenes):
+        automation = FakePipeline(self.context)
+        self.coordinator.start('job_1', 'fake', automation, {'title': 'Test', 'scenes': scenes})
+        self.assertTrue(self.finished.wait(10), 'job never finished')
+        return self.updates['job_1'][-1]
+
+    def test_callbacks_before_submit_returns_still_resume_the_job(self):
+        final = self.start_job(['scene one', 'scene two'])
+
+        self.assertEqual(final['status'], 'completed')
+        with open(final['video_path'], 'rb') as f:
+            self.assertEqual(f.read(), VIDEO_BYTES)
+        self.assertEqual(self.store.jobs, {})
+
+    def test_error_callback_fails_job_and_cancels_other_renders(self):
+        self.queue.fail_prompts = {'scene two'}
+        # Drop scene one's success so it is still pending when scene two fails
+        apply_callback = self.coordinator.apply_callback
+        self.coordinator.apply_callback = lambda job_id, request_id, body: (
+            apply_callback(job_id, request_id, body) if body.get('status') != 'OK' else None)
+
+        final = self.start_job(['scene one', 'scene two'])
+
+        self.assertEqual(final['status'], 'error')
+        self.coordinator.executor.shutdown(wait=True)
+        pending = [rid for rid, entry in self.queue.requests.items() if entry['arguments']['prompt'] == 'scene one']
+        self.assertEqual(self.queue.cancelled, pending)
+
+    def test_qa_rerender_replaces_only_the_failed_render(self):
+        FakePipeline.failing_qa = {1}
+        final = self.start_job(['scene one', 'scene two'])
+
+        self.assertEqual(final['status'], 'completed')
+        prompts = sorted(entry['arguments']['prompt'] for entry in self.queue.requests.values())
+        self.assertEqual(prompts, ['scene one', 'scene two', 'scene two'])
+
+    def test_error_for_replaced_render_is_ignored(self):
+        job = {'job_id': 'job_1', 'token': 't', 'expected': 1, 'resuming': False,
+               'renders': [{'index': 0, 'request_id': 'new', 'status': 'pending'}],
+               'retired': ['old'], 'early_callbacks': {}}
+        self.store.jobs['job_1'] = job
+
+        self.assertTrue(self.coordinator.handle_webhook('job_1', 't', {'request_id': 'old', 'status': 'ERROR'}))
+        self.assertIn('job_1', self.store.jobs)
+        self.assertNotIn('job_1', self.updates)
+
+    def test_restart_refuses_to_upload_to_default_channel(self):
+        job = {'upload': True, 'youtube_account': 'someone-else.apps.googleusercontent.com',
+               'youtube_token_path': os.path.join(self.tmp, 'missing.json')}
+        with self.assertRaisesRegex(Exception, 'could not be restored'):
+            self.coordinator.restore_context('job_gone', job)
+
+    def test_restart_restores_the_jobs_own_account_from_its_token(self):
+        token_path = os.path.join(self.tmp, 'token.json')
+        with open(token_path, 'w') as f:
+            json.dump({'client_id': 'owner.apps.googleusercontent.com', 'client_secret': 's',
+                       'refresh_token': 'r'}, f)
+        job = {'upload': True, 'youtube_account': 'owner.apps.googleusercontent.com',
+               'youtube_token_path': token_path}
+
+        context = self.coordinator.restore_context('job_gone', job)
+        self.assertEqual(context.youtube_account, 'owner.apps.googleusercontent.com')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Scheduler slot parsing, catch-up window and topic claims
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scheduler
+from scheduler import Slot, VideoScheduler, parse_slots
+
+MORNING = Slot(7, 0, 'single')
+
+
+class FakeTopics:
+    """get_next_topic over rows 2-4, honouring exclude_rows like the real pipelines"""
+
+    def __init__(self, rows=(2, 3, 4)):
+        self.rows = rows
+        self.processed = []
+
+    def get_next_topic(self, exclude_rows=None):
+        for row in self.rows:
+            if row not in (exclude_rows or set()):
+                return {'row': row, 'topic': f"Topic {row}", 'id': f"{row - 1:03d}"}
+        return None
+
+    def process_video(self, topic_data):
+        self.processed.append(topic_data['row'])
+
+
+class ParseSlotsTest(unittest.TestCase):
+
+    def test_parses_times_and_pipelines(self):
+        self.assertEqual(parse_slots(" 07:00, 14:30@multi ,,19:05"),
+                         [Slot(7, 0, 'single'), Slot(14, 30, 'multi'), Slot(19, 5, 'single')])
+
+    def test_rejects_out_of_range_and_malformed_times(self):
+        for spec in ["25:00", "7:60", "-1:00", "07", "7:00:00", "ab:cd"]:
+            with self.subTest(spec=spec):
+                with self.assertRaisesRegex(ValueError, 'Invalid time'):
+                    parse_slots(spec)
+
+    def test_rejects_unknown_pipeline(self):
+        with self.assertRaisesRegex(ValueError, 'Unknown pipeline'):
+            parse_slots("07:00@weekly")
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        env = mock.patch.dict(os.environ, {
+            'SCHEDULER_STATE_PATH': os.path.join(self.tmp, 'state.json'),
+            'SCHEDULE_CATCHUP_MINUTES': '60'
+        })
+        env.start()
+        self.addCleanup(env.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def make_scheduler(self, slots=(MORNING,)) -> VideoScheduler:
+        sched = VideoScheduler(list(slots))
+        self.addCleanup(sched.executor.shutdown, wait=True)
+        return sched
+
+    def test_first_sight_records_the_slot_without_running_it(self):
+        sched = self.make_scheduler()
+        now = datetime(2026, 3, 2, 7, 20)
+
+        self.assertEqual(sched.due_slots(now), [])
+        self.assertEqual(sched.last_run[MORNING.key], datetime(2026, 3, 2, 7, 0))
+        self.assertEqual(sched.due_slots(now), [])
+
+    def test_slot_runs_once_when_its_time_comes(self):
+        sched = self.make_scheduler()
+        sched.due_slots(datetime(2026, 3, 2, 6, 59))
+
+        occurrence = datetime(2026, 3, 2, 7, 0)
+        self.assertEqual(sched.due_slots(occurrence), [(MORNING, occurrence)])
+        self.assertEqual(sched.due_slots(datetime(2026, 3, 2, 7, 5)), [])
+
+    def test_missed_slot_inside_catchup_window_runs_late(self):
+        sched = self.make_scheduler()
+        sched.last_run[MORNING.key] = datetime(2026, 3, 1, 7, 0)
+
+        due = sched.due_slots(datetime(2026, 3, 2, 7, 45))
+        self.assertEqual(due, [(MORNING, datetime(2026, 3, 2, 7, 0))])
+
+    def test_missed_slot_outside_catchup_window_is_skipped(self):
+        sched = self.make_scheduler()
+        sched.last_run[MORNING.key] = datetime(2026, 3, 1, 7, 0)
+
+        self.assertEqual(sched.due_slots(datetime(2026, 3, 2, 9, 0)), [])
+        # Marked as handled, so it isn't reconsidered on the next tick
+        self.assertEqual(sched.last_run[MORNING.key], datetime(2026, 3, 2, 7, 0))
+
+    def test_state_survives_a_restart(self):
+        sched = self.make_scheduler()
+        sched.last_run[MORNING.key] = datetime(2026, 3, 1, 7, 0)
+        sched.save_state()
+
+        restarted = self.make_scheduler()
+        self.assertEqual(len(restarted.due_slots(datetime(2026, 3, 2, 7, 30))), 1)
+
+    def test_next_deadline_is_the_earliest_upcoming_slot(self):
+        sched = self.make_scheduler([MORNING, Slot(19, 0, 'multi')])
+        self.assertEqual(sched.next_deadline(datetime(2026, 3, 2, 7, 0)), datetime(2026, 3, 2, 19, 0))
+        self.assertEqual(sched.next_deadline(datetime(2026, 3, 2, 20, 0)), datetime(2026, 3, 3, 7, 0))
+
+    def test_concurrent_claims_never_share_a_row(self):
+        sched = self.make_scheduler()
+        topics = FakeTopics()
+        claims = []
+        threads = [threading.Thread(target=lambda: claims.append(sched.claim_topic(topics))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        rows = [claim['row'] for claim in claims if claim]
+        self.assertEqual(sorted(rows), [2, 3, 4])
+        self.assertEqual(claims.count(None), 1)
+
+    def test_finished_slot_releases_its_row(self):
+        sched = self.make_scheduler()
+        topics = FakeTopics()
+        with mock.patch.dict(scheduler.PIPELINES, {'single': lambda: topics}):
+            sched.run_slot(MORNING, datetime(2026, 3, 2, 7, 0))
+            sched.run_slot(MORNING, datetime(2026, 3, 3, 7, 0))
+
+        self.assertEqual(topics.processed, [2, 2])
+        self.assertEqual(sched._active_rows, set())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate topic detection: rewordings match, different subjects don't
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from topic_index import TopicSimilarityIndex
+
+PUBLISHED = [
+    "How AI is changing coding",
+    "Build a website in 60 seconds",
+    "Top 10 facts about the Roman Empire",
+    "5 Python tricks you need to know",
+    "Why do cats purr",
+    "How black holes form",
+    "The history of the printing press",
+    "What is quantum computing",
+    "Top 10 facts about octopuses",
+    "5 JavaScript tricks every developer should know",
+]
+
+
+class TopicIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = TopicSimilarityIndex(0.75)
+        for position, topic in enumerate(PUBLISHED):
+            self.index.add(('published', position), topic, f"{position + 1:03d}", taken=True)
+
+    def test_rewordings_are_duplicates(self):
+        for topic, original in [
+            ("How is AI changing coding?", "How AI is changing coding"),
+            ("Why cats purr", "Why do cats purr"),
+            ("How do black holes form", "How black holes form"),
+            ("10 facts about the Roman Empire", "Top 10 facts about the Roman Empire"),
+            ("What's quantum computing?", "What is quantum computing"),
+            ("Top 10 facts about octopus", "Top 10 facts about octopuses"),
+        ]:
+            with self.subTest(topic=topic):
+                duplicate = self.index.find_duplicate(topic)
+                self.assertIsNotNone(duplicate)
+                self.assertEqual(duplicate['text'], original)
+
+    def test_same_template_about_another_subject_is_not_a_duplicate(self):
+        for topic in [
+            "5 Rust tricks you need to know",
+            "Top 10 facts about the Ottoman Empire",
+            "Top 10 facts about the Roman Republic",
+            "5 Python tricks every developer should know",
+        ]:
+            with self.subTest(topic=topic):
+                self.assertIsNone(self.index.find_duplicate(topic))
+
+    def test_not_a_duplicate_in_a_two_topic_index(self):
+        index = TopicSimilarityIndex(0.75)
+        index.add('a', "Top 10 facts about the Roman Empire", '001', taken=True)
+        self.assertIsNone(index.find_duplicate("Top 10 facts about the Ottoman Empire"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Bulk topic ingestion: parsing, exact duplicates and ID allocation
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from topic_ingest import TopicIngestor, parse_topics
+
+
+class FakeTopicsSheet:
+    """Topics sheet rows (ID | Status | Topic) behind the gspread calls ingestion uses"""
+
+    def __init__(self, rows):
+        self.rows = [['ID', 'Status', 'Topic']] + [list(row) for row in rows]
+
+    def get_all_values(self):
+        return [list(row) for row in self.rows]
+
+    def col_values(self, column):
+        return [row[column - 1] for row in self.rows if len(row) >= column]
+
+    def append_rows(self, rows, value_input_option=None):
+        self.rows.extend(rows)
+
+
+class ParseTopicsTest(unittest.TestCase):
+
+    def test_json_drops_null_and_non_scalar_items(self):
+        payload = '["a", null, 5, true, [1], {"x": 1}, {"topic": null}, {"topic": "b"}, " "]'
+        self.assertEqual(parse_topics(payload, 'json'), ['a', '5', 'b'])
+
+    def test_json_object_with_topics_list(self):
+        self.assertEqual(parse_topics('{"topics": [{"topic": " c "}]}', 'json'), ['c'])
+
+    def test_csv_topic_column_or_first_column(self):
+        self.assertEqual(parse_topics("id,Topic\n1,First\n2,\n", 'csv'), ['First'])
+        self.assertEqual(parse_topics("Only column\nSecond\n", 'csv'), ['Only column', 'Second'])
+
+
+class TopicIngestorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        env = mock.patch.dict(os.environ, {
+            'TOPIC_ID_STATE_PATH': os.path.join(self.tmp, 'topic_ids.json'),
+            'TOPIC_INDEX_MAX_AGE_SECONDS': '0'
+        })
+        env.start()
+        self.addCleanup(env.stop)
+
+    def test_skips_exact_duplicates(self):
+        sheet = FakeTopicsSheet([['001', 'Published', 'How AI is changing coding']])
+        result = TopicIngestor(sheet).ingest(['how AI is changing coding!', 'New topic', 'New  topic'])
+
+        self.assertEqual(result, {'added': 1, 'duplicates': 2, 'ids': ['002']})
+
+    def test_ids_continue_after_ids_typed_into_the_sheet(self):
+        sheet = FakeTopicsSheet([['001', '', 'First']])
+        ingestor = TopicIngestor(sheet)
+        self.assertEqual(ingestor.ingest(['Second'])['ids'], ['002'])
+
+        # Someone adds rows by hand after the counter file exists
+        sheet.rows.append(['007', '', 'Typed in'])
+        sheet.rows.append(['', '', 'No ID yet'])
+        self.assertEqual(ingestor.ingest(['Third', 'Fourth'])['ids'], ['008', '009'])
+
+    def test_saved_counter_wins_over_a_lower_sheet_id(self):
+        sheet = FakeTopicsSheet([['001', '', 'First']])
+        TopicIngestor(sheet).ingest(['Second', 'Third'])
+        # Rows deleted from the sheet don't hand their IDs out again
+        del sheet.rows[2:]
+        self.assertEqual(TopicIngestor(sheet).ingest(['Fourth'])['ids'], ['004'])
+
+
+if __name__ == '__main__':
+    unittest.main()
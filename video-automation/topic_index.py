@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate topic detection
+Character n-gram TF-IDF index over Topics and Published rows, so paraphrased
+topics are caught before they cost a Grok, Veo and upload run
+"""
+
+import os
+import re
+import math
+import threading
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional
+import numpy as np
+from loguru import logger
+
+NGRAM_SIZES = (3, 4)
+
+# Entry norms are recomputed whenever the index has grown by this factor
+NORM_REBUILD_GROWTH = 1.5
+
+# Topics sheet statuses that mean the topic is taken
+TAKEN_STATUSES = ('Published', 'Processing')
+
+# Words sharing this many leading letters count as the same word (tip/tips, form/formed)
+WORD_PREFIX = 5
+
+# What the pipelines do with a near-duplicate: only log it, or mark it in the sheet and move on
+DUPLICATE_ACTIONS = ('skip', 'log')
+
+
+def normalize_topic(text: str) -> str:
+    """Canonical form used for duplicate detection: lowercase words without punctuation"""
+    return ' '.join(re.sub(r'[^\w\s]', ' ', text.lower()).split())
+
+
+def topic_features(text: str) -> Dict[str, float]:
+    """Character n-grams plus whole words, with sublinear term frequency"""
+    normalized = normalize_topic(text)
+    padded = f" {normalized} "
+    counts = Counter(padded[i:i + n] for n in NGRAM_SIZES for i in range(len(padded) - n + 1))
+    # Words are prefixed so they can't collide with an n-gram of the same text
+    counts.update(f"#{word}" for word in normalized.split())
+    return {feature: 1.0 + math.log(count) for feature, count in counts.items()}
+
+
+def same_word(a: str, b: str) -> bool:
+    """Equal words, or words sharing a prefix of at least 3 letters (up to WORD_PREFIX)"""
+    length = min(len(a), len(b), WORD_PREFIX)
+    return a == b or (length >= 3 and a[:length] == b[:length])
+
+
+def as_numpy(values: array, dtype) -> np.ndarray:
+    """Zero-copy NumPy view of an array.array; drop it before the array grows again"""
+    return np.frombuffer(values, dtype=dtype, count=len(values))
+
+
+class TopicSimilarityIndex:
+    """Inverted index of topic n-grams; a lookup scores every topic in one bincount"""
+
+    def __init__(self, threshold: float, action: str = 'skip'):
+        self.threshold = threshold
+        self.action = action
+        self._lock = threading.RLock()
+        # Per entry
+        self.keys = []
+        self.labels = []
+        self.texts = []
+        self.norms = array('f')
+        self.active = array('b')
+        self.taken = array('b')
+        self.entry_by_key = {}
+        # Per feature: (entry ids, term frequencies), appended to as topics arrive
+        self.postings = {}
+        self.norm_basis = 0
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def idf(self, feature: str) -> float:
+        postings = self.postings.get(feature)
+        df = len(postings[0]) if postings else 0
+        return math.log((1 + len(self.keys)) / (1 + df)) + 1.0
+
+    def add(self, key, text: str, label: str, taken: bool) -> int:
+        """Index one topic; replaces the previous entry stored under the same key"""
+        with self._lock:
+            previous = self.entry_by_key.get(key)
+            if previous is not None:
+                if self.texts[previous] == text:
+                    self.taken[previous] = taken
+                    return previous
+                self.active[previous] = False
+
+            entry = len(self.keys)
+            features = topic_features(text)
+            dfs = []
+            for feature, tf in features.items():
+                if feature not in self.postings:
+                    self.postings[feature] = (array('i'), array('f'))
+                entries, tfs = self.postings[feature]
+                entries.append(entry)
+                tfs.append(tf)
+                dfs.append(len(entries))
+
+            self.keys.append(key)
+            self.labels.append(label)
+            self.texts.append(text)
+            self.entry_by_key[key] = entry
+            self.active.append(True)
+            self.taken.append(taken)
+            # Norm uses today's IDF; rebuild_norms() corrects the drift as the index grows
+            idfs = np.log((1 + len(self.keys)) / (1 + np.array(dfs, dtype=np.float64))) + 1.0
+            tf_idf = np.fromiter(features.values(), dtype=np.float64, count=len(features)) * idfs
+            self.norms.append(float(np.sqrt(np.dot(tf_idf, tf_idf))))
+
+            if len(self.keys) > self.norm_basis * NORM_REBUILD_GROWTH:
+                self.rebuild_norms()
+            return entry
+
+    def rebuild_norms(self):
+        """Recompute every entry's TF-IDF norm with the current document frequencies"""
+        with self._lock:
+            if not self.postings:
+                return
+            entries = np.concatenate([as_numpy(postings[0], np.int32) for postings in self.postings.values()])
+            weights = np.concatenate([
+                as_numpy(postings[1], np.float32) * self.idf(feature) for feature, postings in self.postings.items()
+            ])
+            norms_sq = np.bincount(entries, weights=weights.astype(np.float64) ** 2, minlength=len(self.keys))
+            self.norms = array('f', np.sqrt(norms_sq).astype(np.float32).tobytes())
+            self.norm_basis = len(self.keys)
+
+    def scores(self, text: str) -> np.ndarray:
+        """Cosine similarity of text against every indexed entry"""
+        with self._lock:
+            return self._scores(topic_features(text))
+
+    def _scores(self, features: Dict[str, float]) -> np.ndarray:
+        entries, weights = [], []
+        query_norm_sq = 0.0
+        for feature, tf in features.items():
+            idf = self.idf(feature)
+            query_norm_sq += (tf * idf) ** 2
+            postings = self.postings.get(feature)
+            if postings:
+                entries.append(as_numpy(postings[0], np.int32))
+                weights.append(as_numpy(postings[1], np.float32) * (tf * idf * idf))
+
+        count = len(self.keys)
+        if not entries or query_norm_sq == 0:
+            return np.zeros(count)
+
+        dots = np.bincount(np.concatenate(entries), weights=np.concatenate(weights), minlength=count)
+        norms = as_numpy(self.norms, np.float32) * math.sqrt(query_norm_sq)
+        # IDF keeps moving between norm rebuilds, which can push scores slightly past 1
+        return np.minimum(np.divide(dots, norms, out=np.zeros(count), where=norms > 0), 1.0)
+
+    def rarest_word(self, words: List[str]) -> str:
+        """Word with the highest IDF, longest first on ties; single letters only as a last resort"""
+        candidates = [word for word in words if len(word) > 1] or words
+        return max(candidates, key=lambda word: (self.idf(f"#{word}"), len(word)))
+
+    def words_agree(self, a: str, b: str) -> bool:
+        """Whether each topic's rarest word also appears in the other
+
+        Character n-grams score "Ottoman Empire" close to "Roman Empire" and "5 Rust tricks"
+        close to "5 Python tricks"; the word that tells such topics apart is the rare one.
+        """
+        words_a, words_b = normalize_topic(a).split(), normalize_topic(b).split()
+        if not words_a or not words_b:
+            return False
+        return (any(same_word(self.rarest_word(words_a), word) for word in words_b)
+                and any(same_word(self.rarest_word(words_b), word) for word in words_a))
+
+    def find_duplicate(self, text: str, exclude_key=None, taken_keys=()) -> Optional[Dict]:
+        """Best match among taken topics scoring at least the threshold whose words agree, or None"""
+        with self._lock:
+            if not self.keys:
+                return None
+
+            candidates = as_numpy(self.active, bool) & as_numpy(self.taken, bool)
+            for key in taken_keys:
+                entry = self.entry_by_key.get(key)
+                if entry is not None:
+                    candidates[entry] = True
+            own = self.entry_by_key.get(exclude_key)
+            if own is not None:
+                candidates[own] = False
+
+            scores = np.where(candidates, self._scores(topic_features(text)), 0.0)
+            above = np.flatnonzero(scores >= self.threshold)
+            for best in above[np.argsort(-scores[above], kind='stable')]:
+                if self.words_agree(text, self.texts[best]):
+                    return {'key': self.keys[best], 'label': self.labels[best],
+                            'text': self.texts[best], 'score': float(scores[best])}
+            return None
+
+    def sync_topics(self, records: List[Dict]):
+        """Add new or edited Topics rows (row numbers start at 2) and refresh their status
+
+        Unchanged rows cost a dict lookup, so this is cheap to call on every read of the sheet.
+        """
+        with self._lock:
+            for row, record in enumerate(records, start=2):
+                topic = record.get('Topic')
+                if topic:
+                    taken = record.get('Status') in TAKEN_STATUSES
+                    self.add(('topic', row), str(topic), str(record.get('ID')), taken)
+
+
+# One index per spreadsheet, shared by every pipeline instance in the process
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_topic_index(spreadsheet_id: str, videos_sheet) -> Optional[TopicSimilarityIndex]:
+    """Shared index for a spreadsheet, seeded from the Published sheet on first use"""
+    if os.getenv('TOPIC_DEDUP_ENABLED', 'true').lower() != 'true':
+        return None
+
+    action = os.getenv('TOPIC_DUPLICATE_ACTION', 'skip').strip().lower()
+    if action not in DUPLICATE_ACTIONS:
+        raise ValueError(f"TOPIC_DUPLICATE_ACTION must be one of {', '.join(DUPLICATE_ACTIONS)}, got '{action}'")
+
+    with _indexes_lock:
+        if spreadsheet_id not in _indexes:
+            index = TopicSimilarityIndex(float(os.getenv('TOPIC_DUPLICATE_THRESHOLD', '0.75')), action)
+            # Published columns: ID | Topic | Title | Video URL | Published Date | Views
+            for position, row in enumerate(videos_sheet.get_all_values()[1:]):
+                if len(row) > 1 and row[1]:
+                    index.add(('published', position), row[1], row[0], taken=True)
+            logger.info(f"Topic index seeded with {len(index)} published topics")
+            _indexes[spreadsheet_id] = index
+        return _indexes[spreadsheet_id]
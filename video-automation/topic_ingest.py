@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Bulk topic ingestion
+Adds thousands of topics to the Topics sheet in a few batched writes
+"""
+
+import os
+import io
+import csv
+import json
+import time
+import argparse
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+from loguru import logger
+from dotenv import load_dotenv
+from video_automation import VideoAutomation
+from topic_index import normalize_topic
+
+load_dotenv()
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Rows per append_rows call, well under the Sheets API request size limit
+APPEND_BATCH_SIZE = 500
+
+# Topics sheet columns: ID | Status | Topic
+ID_COLUMN = 1
+TOPIC_COLUMN = 3
+
+# JSON values that can stand for a topic; null, lists and objects are dropped
+SCALAR_TYPES = (str, int, float)
+
+
+@contextmanager
+def file_lock(path: str):
+    """Exclusive lock on path shared by every process on the machine (CLI and web app alike)"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a+') as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def parse_topics(payload: str, fmt: str) -> List[str]:
+    """Read topics from CSV (a 'topic' column or the first column) or a JSON list"""
+    if fmt == 'json':
+        items = json.loads(payload)
+        if isinstance(items, dict):
+            items = items.get('topics', [])
+        values = [item.get('topic') if isinstance(item, dict) else item for item in items]
+        # bool is an int subclass, but true/false is never a topic
+        topics = [str(value) for value in values
+                  if isinstance(value, SCALAR_TYPES) and not isinstance(value, bool)]
+    elif fmt == 'csv':
+        rows = list(csv.reader(io.StringIO(payload)))
+        column = 0
+        if rows and 'topic' in [cell.strip().lower() for cell in rows[0]]:
+            column = [cell.strip().lower() for cell in rows[0]].index('topic')
+            rows = rows[1:]
+        topics = [row[column] for row in rows if len(row) > column]
+    else:
+        raise ValueError(f"Unsupported topic format '{fmt}'")
+    return [topic.strip() for topic in topics if topic and topic.strip()]
+
+
+def next_free_id(ids: Iterable) -> int:
+    """One past the highest numeric ID, or 1 when there is none"""
+    numeric = [int(value) for value in ids if str(value).strip().isdigit()]
+    return max(numeric, default=0) + 1
+
+
+class TopicIdAllocator:
+    """Hands out increasing topic IDs from a local counter instead of counting sheet rows"""
+
+    def __init__(self, topics_sheet, state_path: str):
+        self.topics_sheet = topics_sheet
+        self.state_path = state_path
+        self._lock = threading.Lock()
+
+    def seed(self, sheet_next_id: Optional[int] = None) -> int:
+        """Next free ID: the saved counter, raised past the highest ID known to be in the sheet
+
+        sheet_next_id comes from the caller's latest read of the sheet; without one the ID
+        column is only read when there is no saved counter yet.
+        """
+        if os.path.exists(self.state_path):
+            with open(self.state_path, 'r') as f:
+                saved = json.load(f)['next_id']
+        elif sheet_next_id is None:
+            return next_free_id(self.topics_sheet.col_values(ID_COLUMN)[1:])
+        else:
+            saved = 1
+        return max(saved, sheet_next_id or 1)
+
+    def allocate(self, count: int, sheet_next_id: Optional[int] = None) -> List[str]:
+        """Reserve count consecutive IDs, persisting the counter before they are used"""
+        # The counter is re-read under a file lock every time so other processes never get the same IDs
+        with self._lock, file_lock(f"{self.state_path}.lock"):
+            first = self.seed(sheet_next_id)
+
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({'next_id': first + count}, f)
+            os.replace(tmp_path, self.state_path)
+
+        return [f"{n:03d}" for n in range(first, first + count)]
+
+
+class TopicIngestor:
+    """Deduplicates topics against the sheet and appends new ones in batches"""
+
+    def __init__(self, topics_sheet):
+        self.topics_sheet = topics_sheet
+        self.allocator = TopicIdAllocator(
+            topics_sheet, os.getenv('TOPIC_ID_STATE_PATH', 'config/topic_ids.json'))
+        self.index_max_age = float(os.getenv('TOPIC_INDEX_MAX_AGE_SECONDS', '60'))
+        self._lock = threading.Lock()
+        self._index = None
+        self._index_loaded_at = 0.0
+        self._sheet_next_id = None
+
+    def load_index(self):
+        """Build the normalised-topic index and note the highest ID, re-reading the sheet once stale
+
+        Rows and IDs added by hand or by another process in between are only seen after a
+        refresh, so a duplicate topic or a clashing hand-typed ID can still slip in within
+        TOPIC_INDEX_MAX_AGE_SECONDS of one.
+        """
+        if self._index is None or time.monotonic() - self._index_loaded_at > self.index_max_age:
+            # IDs and topics in one read
+            rows = self.topics_sheet.get_all_values()[1:]
+            existing = [row[TOPIC_COLUMN - 1] for row in rows if len(row) >= TOPIC_COLUMN]
+            self._index = {normalize_topic(topic) for topic in existing if topic}
+            self._sheet_next_id = next_free_id(row[ID_COLUMN - 1] for row in rows if row)
+            self._index_loaded_at = time.monotonic()
+            logger.info(f"Loaded {len(self._index)} existing topics into the duplicate index")
+
+    def ingest(self, topics: Iterable[str]) -> Dict:
+        """Add topics that are not already in the sheet; returns counts and the new IDs"""
+        with self._lock:
+            self.load_index()
+
+            new_topics = []
+            duplicates = 0
+            for topic in topics:
+                key = normalize_topic(topic)
+                if not key or key in self._index:
+                    duplicates += 1
+                    continue
+                self._index.add(key)
+                new_topics.append(topic)
+
+            ids = self.allocator.allocate(len(new_topics), self._sheet_next_id) if new_topics else []
+            rows = [[topic_id, '', topic] for topic_id, topic in zip(ids, new_topics)]
+
+            try:
+                for start in range(0, len(rows), APPEND_BATCH_SIZE):
+                    self.topics_sheet.append_rows(rows[start:start + APPEND_BATCH_SIZE], value_input_option='RAW')
+            except Exception:
+                # Rows past the failed batch were never written, let them be retried
+                for row in rows[start:]:
+                    self._index.discard(normalize_topic(row[2]))
+                raise
+
+        logger.info(f"Ingested {len(rows)} topics ({duplicates} duplicates skipped)")
+        return {'added': len(rows), 'duplicates': duplicates, 'ids': ids}
+
+
+def main():
+    """Ingest topics from a CSV or JSON file"""
+    parser = argparse.ArgumentParser(description='Bulk add topics to the Topics sheet')
+    parser.add_argument('path', help='CSV or JSON file of topics')
+    parser.add_argument('--format', choices=['csv', 'json'], help='defaults to the file extension')
+    args = parser.parse_args()
+
+    fmt = args.format or ('json' if args.path.lower().endswith('.json') else 'csv')
+    # utf-8-sig drops the byte order mark Excel puts in front of CSV exports
+    with open(args.path, 'r', encoding='utf-8-sig') as f:
+        topics = parse_topics(f.read(), fmt)
+
+    result = TopicIngestor(VideoAutomation().topics_sheet).ingest(topics)
+    print(f"Added {result['added']} topics, skipped {result['duplicates']} duplicates")
+
+if __name__ == "__main__":
+    main()
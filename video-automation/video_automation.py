@@ -7,18 +7,20 @@ Generates 2-3 videos daily using Grok API and Google Veo 3
 import os
 import json
 import time
+import uuid
 from datetime import datetime
 from typing import Dict, List, Optional
 import gspread
 from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
-from google.auth.transport.requests import Request
-from google_auth_oauthlib.flow import InstalledAppFlow
 import requests
 from loguru import logger
 from dotenv import load_dotenv
-import fal_client
+from job_context import JobContext, client_pool
+from render_qa import RenderQA
+from video_variants import VARIANTS, PREVIEW_VARIANT, derive_variants, publish_variant_names
+from render_scheduler import RenderScheduler, latency_tracker, VEO_ENDPOINT
+from topic_index import get_topic_index
 
 # Load environment variables
 load_dotenv()
@@ -27,12 +29,15 @@ load_dotenv()
 logger.add("logs/video_automation_{time}.log", rotation="1 day", retention="7 days")
 
 class VideoAutomation:
-    def __init__(self):
+    def __init__(self, context: Optional[JobContext] = None):
+        # Credentials travel with the instance, never through os.environ
+        self.context = context or JobContext.from_env()
         self.setup_google_sheets()
         self.setup_youtube()
-        self.grok_api_key = os.getenv('GROK_API_KEY')
-        self.grok_api_url = os.getenv('GROK_API_URL')
-        self.fal_api_key = os.getenv('FAL_API_KEY')
+        self.qa = RenderQA()
+        self.renderer = RenderScheduler(client_pool.fal(self.context), latency_tracker)
+        # Extra formats derived from each render and uploaded alongside it
+        self.variant_names = publish_variant_names()
         
     def setup_google_sheets(self):
         """Initialize Google Sheets connection"""
@@ -46,49 +51,48 @@ class VideoAutomation:
         self.videos_sheet = self.spreadsheet.worksheet('Published')
         
     def setup_youtube(self):
-        """Initialize YouTube API connection"""
-        SCOPES = ['https://www.googleapis.com/auth/youtube.upload']
-        creds = None
-        
-        token_path = os.getenv('YOUTUBE_CREDENTIALS_PATH')
-        if os.path.exists(token_path):
-            with open(token_path, 'r') as token:
-                creds_data = json.load(token)
-                # Create credentials from saved token
-                from google.oauth2.credentials import Credentials as OAuthCredentials
-                creds = OAuthCredentials.from_authorized_user_info(creds_data, SCOPES)
-        
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    os.getenv('YOUTUBE_CLIENT_SECRETS_PATH'), SCOPES)
-                creds = flow.run_local_server(port=0)
-            
-            # Save credentials for next run
-            with open(token_path, 'w') as token:
-                token.write(creds.to_json())
-        
-        self.youtube = build('youtube', 'v3', credentials=creds)
-        
-    def get_next_topic(self) -> Optional[Dict]:
-        """Get next unprocessed topic from Google Sheets"""
+        """Initialize YouTube API connection for this job's account"""
+        if not self.context.youtube_client_config:
+            self.youtube = None
+            return
+        self.youtube = client_pool.youtube(self.context)
+        
+    def get_next_topic(self, exclude_rows: Optional[set] = None) -> Optional[Dict]:
+        """Get next unprocessed topic from Google Sheets, skipping rows already claimed"""
+        exclude_rows = exclude_rows or set()
         all_records = self.topics_sheet.get_all_records()
+        topic_index = get_topic_index(os.getenv('SPREADSHEET_ID'), self.videos_sheet)
+        if topic_index:
+            topic_index.sync_topics(all_records)
         for idx, record in enumerate(all_records, start=2):  # Start at 2 (header is row 1)
-            if record.get('Status') != 'Published':
-                return {'row': idx, 'topic': record.get('Topic'), 'id': record.get('ID')}
+            if idx in exclude_rows:
+                continue
+            status = str(record.get('Status', ''))
+            if status == 'Published' or status.startswith('Duplicate'):
+                continue
+            if topic_index:
+                # Rows claimed by other workers count as taken even before their status is written
+                duplicate = topic_index.find_duplicate(
+                    str(record.get('Topic', '')),
+                    exclude_key=('topic', idx),
+                    taken_keys=[('topic', row) for row in exclude_rows]
+                )
+                if duplicate and topic_index.action == 'skip':
+                    logger.info(f"Skipping topic {record.get('ID')}, near-duplicate of "
+                                f"{duplicate['label']} '{duplicate['text']}' ({duplicate['score']:.2f})")
+                    self.topics_sheet.update_cell(idx, 2, f"Duplicate of {duplicate['label']}")
+                    continue
+                if duplicate:
+                    logger.warning(f"Topic {record.get('ID')} looks like a near-duplicate of "
+                                   f"{duplicate['label']} '{duplicate['text']}' ({duplicate['score']:.2f}), "
+                                   f"making it anyway (TOPIC_DUPLICATE_ACTION=log)")
+            return {'row': idx, 'topic': record.get('Topic'), 'id': record.get('ID')}
         return None
         
     def generate_script(self, topic: str) -> Dict:
         """Generate video script using Grok API"""
         logger.info(f"Generating script for topic: {topic}")
         
-        headers = {
-            'Authorization': f'Bearer {self.grok_api_key}',
-            'Content-Type': 'application/json'
-        }
-        
         prompt = f"""Create a compelling 8-second video script about: {topic}
         
         Format the response as JSON with:
@@ -107,47 +111,37 @@ class VideoAutomation:
             'temperature': 0.7
         }
         
-        response = requests.post(self.grok_api_url, headers=headers, json=data)
+        response = client_pool.grok(self.context).post(self.context.grok_api_url, json=data)
         response.raise_for_status()
         
         content = response.json()['choices'][0]['message']['content']
         # Parse JSON from response
         return json.loads(content)
         
-    def generate_video(self, script_data: Dict) -> str:
-        """Generate video using Google Veo 3 via FAL API"""
-        logger.info("Generating video with Veo 3")
-        
-        # FAL client will use FAL_KEY from environment
-        
+    def video_arguments(self, script_data: Dict) -> Dict:
+        """Veo 3 request arguments for a script"""
         # Combine visual prompts into video generation prompt
         video_prompt = f"{script_data['title']}. " + " ".join(script_data['visual_prompts'])
         
-        # Generate video using Google Veo 3
-        def on_queue_update(update):
-            if isinstance(update, fal_client.InProgress):
-                for log in update.logs:
-                    logger.info(f"Veo3 Progress: {log['message']}")
+        return {
+            "prompt": video_prompt,
+            "aspect_ratio": "16:9",  # Horizontal standard YouTube
+            "duration": "8s"  # Veo 3 currently only supports 8 seconds
+        }
         
-        # Standard horizontal video format
+    def render_requests(self, script_data: Dict) -> List[Dict]:
+        """Every Veo request this pipeline needs for a script, in order"""
+        return [self.video_arguments(script_data)]
         
-        result = fal_client.subscribe(
-            "fal-ai/veo3/fast",
-            arguments={
-                "prompt": video_prompt,
-                "aspect_ratio": "16:9",  # Horizontal standard YouTube
-                "duration": "8s"  # Veo 3 currently only supports 8 seconds
-            },
-            with_logs=True,
-            on_queue_update=on_queue_update
-        )
-        
-        # Log the result to see structure
-        logger.info(f"Veo3 result: {result}")
+    def output_path(self, name: str) -> str:
+        """Unique path under output/ so parallel jobs never write to the same file"""
+        return f"output/{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.mp4"
         
+    def download_render(self, result: Dict, index: int = 0) -> str:
+        """Save a finished Veo render to output/"""
         # Download video - check for different possible keys
         video_url = result.get('video', {}).get('url') or result.get('url') or result.get('video_url')
-        video_path = f"output/video_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp4"
+        video_path = self.output_path('video')
         
         response = requests.get(video_url)
         with open(video_path, 'wb') as f:
@@ -156,8 +150,44 @@ class VideoAutomation:
         logger.info(f"Video saved to: {video_path}")
         return video_path
         
+    def check_renders(self, paths: List[str]) -> Dict[int, List[str]]:
+        """Render QA for downloaded renders; returns {render index: problems} for failures"""
+        issues = self.qa.check_video(paths[0], '16:9')
+        return {0: issues} if issues else {}
+        
+    def assemble(self, paths: List[str], script_data: Dict) -> str:
+        """Turn the downloaded renders into the video to publish"""
+        return paths[0]
+        
+    def generate_video(self, script_data: Dict) -> str:
+        """Generate video using Google Veo 3 via FAL API"""
+        logger.info("Generating video with Veo 3")
+        
+        # Generate video using Google Veo 3, hedging the request if it runs unusually long
+        result = self.renderer.render(VEO_ENDPOINT, arguments=self.video_arguments(script_data), label="Veo3")
+        
+        # Log the result to see structure
+        logger.info(f"Veo3 result: {result}")
+        
+        return self.download_render(result)
+        
+    def generate_checked_video(self, script_data: Dict) -> str:
+        """Generate a video, re-rendering it if it fails render QA"""
+        for attempt in range(self.qa.max_retries + 1):
+            video_path = self.generate_video(script_data)
+            issues = self.check_renders([video_path]).get(0)
+            if not issues:
+                return video_path
+            if attempt < self.qa.max_retries:
+                logger.info(f"Re-rendering video (attempt {attempt + 2})")
+                os.remove(video_path)
+        
+        raise Exception(f"Render QA failed for {video_path}: {', '.join(issues)}")
+        
     def upload_to_youtube(self, video_path: str, script_data: Dict) -> str:
         """Upload video to YouTube"""
+        if self.youtube is None:
+            raise Exception("YouTube is not configured (missing client secrets)")
         logger.info("Uploading to YouTube")
         
         body = {
@@ -188,6 +218,30 @@ class VideoAutomation:
         logger.info(f"Video uploaded: {video_url}")
         return video_url
         
+    def publish_variants(self, topic_data: Optional[Dict], video_path: str, script_data: Dict) -> Dict[str, str]:
+        """Upload the PUBLISH_VARIANTS formats of an already published render, no new generation calls"""
+        if not self.variant_names:
+            return {}
+        
+        urls = {}
+        try:
+            # The web UI's preview proxy comes out of the same pass; it is kept locally, not uploaded
+            derived = derive_variants(video_path, self.variant_names + [PREVIEW_VARIANT])['outputs']
+            for name in self.variant_names:
+                output = derived[name]
+                variant_script = dict(script_data)
+                if VARIANTS[name]['aspect_ratio'] == '9:16' and '#Shorts' not in variant_script['title']:
+                    variant_script['title'] = f"{variant_script['title'][:90]} #Shorts"
+                
+                urls[name] = self.upload_to_youtube(output['path'], variant_script)
+                if topic_data:
+                    self.update_sheets(topic_data, urls[name], variant_script)
+        except Exception as e:
+            # The main video is already live, so a variant failure shouldn't fail the job
+            logger.error(f"Failed to publish variants: {str(e)}")
+        
+        return urls
+        
     def update_sheets(self, topic_data: Dict, video_url: str, script_data: Dict):
         """Update Google Sheets with published video info"""
         # Update topic status
@@ -203,11 +257,12 @@ class VideoAutomation:
             0  # Initial view count
         ])
         
-    def process_video(self):
+    def process_video(self, topic_data: Optional[Dict] = None):
         """Main workflow: Topic → Script → Video → Upload"""
         try:
-            # Get next topic
-            topic_data = self.get_next_topic()
+            # Get next topic unless the caller already claimed one
+            if topic_data is None:
+                topic_data = self.get_next_topic()
             if not topic_data:
                 logger.info("No pending topics found")
                 return
@@ -220,8 +275,8 @@ class VideoAutomation:
             # Generate script
             script_data = self.generate_script(topic_data['topic'])
             
-            # Generate video
-            video_path = self.generate_video(script_data)
+            # Generate video and check it before spending upload quota
+            video_path = self.generate_checked_video(script_data)
             
             # Upload to YouTube
             video_url = self.upload_to_youtube(video_path, script_data)
@@ -229,12 +284,15 @@ class VideoAutomation:
             # Update sheets
             self.update_sheets(topic_data, video_url, script_data)
             
+            # Publish other formats of the same render
+            self.publish_variants(topic_data, video_path, script_data)
+            
             logger.success(f"Video published successfully: {video_url}")
             
         except Exception as e:
             logger.error(f"Error processing video: {str(e)}")
             # Update status back to Pending on error
-            if 'topic_data' in locals():
+            if topic_data:
                 self.topics_sheet.update_cell(topic_data['row'], 2, 'Error')
             raise
 
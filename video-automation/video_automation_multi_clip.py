@@ -7,19 +7,22 @@ Generates multiple 8-second clips and stitches them together
 import os
 import json
 import time
+import uuid
+import tempfile
 import subprocess
 from datetime import datetime
 from typing import Dict, List, Optional
 import gspread
 from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
-from google.auth.transport.requests import Request
-from google_auth_oauthlib.flow import InstalledAppFlow
 import requests
 from loguru import logger
 from dotenv import load_dotenv
-import fal_client
+from job_context import JobContext, client_pool
+from render_qa import RenderQA
+from video_variants import VARIANTS, PREVIEW_VARIANT, derive_variants, publish_variant_names
+from render_scheduler import RenderScheduler, latency_tracker, VEO_ENDPOINT
+from topic_index import get_topic_index
 
 # Load environment variables
 load_dotenv()
@@ -28,11 +31,15 @@ load_dotenv()
 logger.add("logs/video_automation_{time}.log", rotation="1 day", retention="7 days")
 
 class MultiClipVideoAutomation:
-    def __init__(self):
+    def __init__(self, context: Optional[JobContext] = None):
+        # Credentials travel with the instance, never through os.environ
+        self.context = context or JobContext.from_env()
         self.setup_google_sheets()
         self.setup_youtube()
-        self.grok_api_key = os.getenv('GROK_API_KEY')
-        self.grok_api_url = os.getenv('GROK_API_URL')
+        self.qa = RenderQA()
+        self.renderer = RenderScheduler(client_pool.fal(self.context), latency_tracker)
+        # Extra formats derived from each render and uploaded alongside it
+        self.variant_names = publish_variant_names()
         
     def setup_google_sheets(self):
         """Initialize Google Sheets connection"""
@@ -46,47 +53,48 @@ class MultiClipVideoAutomation:
         self.videos_sheet = self.spreadsheet.worksheet('Published')
         
     def setup_youtube(self):
-        """Initialize YouTube API connection"""
-        SCOPES = ['https://www.googleapis.com/auth/youtube.upload']
-        creds = None
-        
-        token_path = os.getenv('YOUTUBE_CREDENTIALS_PATH')
-        if os.path.exists(token_path):
-            with open(token_path, 'r') as token:
-                creds_data = json.load(token)
-                from google.oauth2.credentials import Credentials as OAuthCredentials
-                creds = OAuthCredentials.from_authorized_user_info(creds_data, SCOPES)
-        
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    os.getenv('YOUTUBE_CLIENT_SECRETS_PATH'), SCOPES)
-                creds = flow.run_local_server(port=0)
-            
-            with open(token_path, 'w') as token:
-                token.write(creds.to_json())
-        
-        self.youtube = build('youtube', 'v3', credentials=creds)
-        
-    def get_next_topic(self) -> Optional[Dict]:
-        """Get next unprocessed topic from Google Sheets"""
+        """Initialize YouTube API connection for this job's account"""
+        if not self.context.youtube_client_config:
+            self.youtube = None
+            return
+        self.youtube = client_pool.youtube(self.context)
+        
+    def get_next_topic(self, exclude_rows: Optional[set] = None) -> Optional[Dict]:
+        """Get next unprocessed topic from Google Sheets, skipping rows already claimed"""
+        exclude_rows = exclude_rows or set()
         all_records = self.topics_sheet.get_all_records()
+        topic_index = get_topic_index(os.getenv('SPREADSHEET_ID'), self.videos_sheet)
+        if topic_index:
+            topic_index.sync_topics(all_records)
         for idx, record in enumerate(all_records, start=2):
-            if record.get('Status') != 'Published':
-                return {'row': idx, 'topic': record.get('Topic'), 'id': record.get('ID')}
+            if idx in exclude_rows:
+                continue
+            status = str(record.get('Status', ''))
+            if status == 'Published' or status.startswith('Duplicate'):
+                continue
+            if topic_index:
+                # Rows claimed by other workers count as taken even before their status is written
+                duplicate = topic_index.find_duplicate(
+                    str(record.get('Topic', '')),
+                    exclude_key=('topic', idx),
+                    taken_keys=[('topic', row) for row in exclude_rows]
+                )
+                if duplicate and topic_index.action == 'skip':
+                    logger.info(f"Skipping topic {record.get('ID')}, near-duplicate of "
+                                f"{duplicate['label']} '{duplicate['text']}' ({duplicate['score']:.2f})")
+                    self.topics_sheet.update_cell(idx, 2, f"Duplicate of {duplicate['label']}")
+                    continue
+                if duplicate:
+                    logger.warning(f"Topic {record.get('ID')} looks like a near-duplicate of "
+                                   f"{duplicate['label']} '{duplicate['text']}' ({duplicate['score']:.2f}), "
+                                   f"making it anyway (TOPIC_DUPLICATE_ACTION=log)")
+            return {'row': idx, 'topic': record.get('Topic'), 'id': record.get('ID')}
         return None
         
     def generate_multi_scene_script(self, topic: str) -> Dict:
         """Generate script with multiple 8-second scenes for a 30-second video"""
         logger.info(f"Generating multi-scene script for topic: {topic}")
         
-        headers = {
-            'Authorization': f'Bearer {self.grok_api_key}',
-            'Content-Type': 'application/json'
-        }
-        
         prompt = f"""Create a compelling 30-second YouTube Shorts script about: {topic}
         
         Format the response as JSON with:
@@ -107,38 +115,36 @@ class MultiClipVideoAutomation:
             'temperature': 0.7
         }
         
-        response = requests.post(self.grok_api_url, headers=headers, json=data)
+        response = client_pool.grok(self.context).post(self.context.grok_api_url, json=data)
         response.raise_for_status()
         
         content = response.json()['choices'][0]['message']['content']
         return json.loads(content)
         
-    def generate_video_clip(self, scene_data: Dict, scene_number: int) -> str:
-        """Generate a single 8-second video clip"""
-        logger.info(f"Generating video clip {scene_number}")
-        
-        def on_queue_update(update):
-            if isinstance(update, fal_client.InProgress):
-                for log in update.logs:
-                    logger.info(f"Veo3 Progress (Scene {scene_number}): {log['message']}")
-        
+    def clip_arguments(self, scene_data: Dict, scene_number: int) -> Dict:
+        """Veo 3 request arguments for one scene"""
         # Add scene context to prompt
         prompt = f"Scene {scene_number} of 4, vertical 9:16 format: {scene_data['visual_prompt']}"
         
-        result = fal_client.subscribe(
-            "fal-ai/veo3/fast",
-            arguments={
-                "prompt": prompt,
-                "aspect_ratio": "9:16",
-                "duration": "8s"
-            },
-            with_logs=True,
-            on_queue_update=on_queue_update
-        )
+        return {
+            "prompt": prompt,
+            "aspect_ratio": "9:16",
+            "duration": "8s"
+        }
         
-        # Download video clip
+    def render_requests(self, script_data: Dict) -> List[Dict]:
+        """Every Veo request this pipeline needs for a script, in scene order"""
+        return [self.clip_arguments(scene, scene['scene_number']) for scene in script_data['scenes']]
+        
+    def output_path(self, name: str) -> str:
+        """Unique path under output/ so parallel jobs never write to the same file"""
+        return f"output/{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.mp4"
+        
+    def download_render(self, result: Dict, index: int = 0) -> str:
+        """Save a finished scene render to output/"""
+        scene_number = index + 1
         video_url = result.get('video', {}).get('url') or result.get('url') or result.get('video_url')
-        clip_path = f"output/clip_{scene_number}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp4"
+        clip_path = self.output_path(f"clip_{scene_number}")
         
         response = requests.get(video_url)
         with open(clip_path, 'wb') as f:
@@ -147,22 +153,66 @@ class MultiClipVideoAutomation:
         logger.info(f"Clip {scene_number} saved to: {clip_path}")
         return clip_path
         
+    def check_renders(self, paths: List[str]) -> Dict[int, List[str]]:
+        """Render QA for downloaded scene clips; returns {scene index: problems} for failures"""
+        return self.qa.check_scenes(paths, '9:16')
+        
+    def assemble(self, paths: List[str], script_data: Dict) -> str:
+        """Turn the downloaded scene clips into the video to publish"""
+        return self.stitch_videos(paths, script_data)
+        
+    def generate_video_clip(self, scene_data: Dict, scene_number: int) -> str:
+        """Generate a single 8-second video clip"""
+        logger.info(f"Generating video clip {scene_number}")
+        
+        result = self.renderer.render(
+            VEO_ENDPOINT,
+            arguments=self.clip_arguments(scene_data, scene_number),
+            label=f"Scene {scene_number}"
+        )
+        
+        return self.download_render(result, scene_number - 1)
+        
+    def generate_checked_clips(self, scenes: List[Dict]) -> List[str]:
+        """Generate every scene clip, re-rendering only the scenes that fail render QA"""
+        clip_paths = []
+        for scene in scenes:
+            clip_path = self.generate_video_clip(scene, scene['scene_number'])
+            clip_paths.append(clip_path)
+            time.sleep(2)  # Brief pause between API calls
+        
+        for attempt in range(self.qa.max_retries + 1):
+            failed = self.check_renders(clip_paths)
+            if not failed:
+                return clip_paths
+            if attempt == self.qa.max_retries:
+                break
+            
+            for idx in sorted(failed):
+                logger.info(f"Re-rendering scene {idx + 1} (attempt {attempt + 2})")
+                os.remove(clip_paths[idx])
+                clip_paths[idx] = self.generate_video_clip(scenes[idx], scenes[idx]['scene_number'])
+                time.sleep(2)
+        
+        summary = '; '.join(f"scene {idx + 1}: {', '.join(issues)}" for idx, issues in sorted(failed.items()))
+        raise Exception(f"Render QA failed: {summary}")
+        
     def stitch_videos(self, clip_paths: List[str], script_data: Dict) -> str:
         """Stitch multiple clips together using ffmpeg"""
         logger.info("Stitching video clips together")
         
-        # Create concat file
-        concat_file = "output/concat_list.txt"
-        with open(concat_file, 'w') as f:
+        # Create concat file, one per call so concurrent stitches can't read each other's list
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', prefix='concat_', dir='output', delete=False) as f:
+            concat_file = f.name
             for clip in clip_paths:
                 f.write(f"file '{os.path.abspath(clip)}'\n")
         
         # Output path
-        output_path = f"output/final_video_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp4"
+        output_path = self.output_path('final_video')
         
         # FFmpeg command to concatenate videos
         cmd = [
-            'ffmpeg',
+            'ffmpeg', '-nostdin',
             '-f', 'concat',
             '-safe', '0',
             '-i', concat_file,
@@ -170,10 +220,12 @@ class MultiClipVideoAutomation:
             output_path
         ]
         
-        subprocess.run(cmd, check=True)
+        try:
+            subprocess.run(cmd, check=True)
+        finally:
+            os.remove(concat_file)
         
         # Clean up temp files
-        os.remove(concat_file)
         for clip in clip_paths:
             os.remove(clip)
             
@@ -182,6 +234,8 @@ class MultiClipVideoAutomation:
         
     def upload_to_youtube(self, video_path: str, script_data: Dict) -> str:
         """Upload video to YouTube"""
+        if self.youtube is None:
+            raise Exception("YouTube is not configured (missing client secrets)")
         logger.info("Uploading to YouTube")
         
         title = script_data['title']
@@ -216,6 +270,30 @@ class MultiClipVideoAutomation:
         logger.info(f"Video uploaded: {video_url}")
         return video_url
         
+    def publish_variants(self, topic_data: Optional[Dict], video_path: str, script_data: Dict) -> Dict[str, str]:
+        """Upload the PUBLISH_VARIANTS formats of an already published render, no new generation calls"""
+        if not self.variant_names:
+            return {}
+        
+        urls = {}
+        try:
+            # The web UI's preview proxy comes out of the same pass; it is kept locally, not uploaded
+            derived = derive_variants(video_path, self.variant_names + [PREVIEW_VARIANT])['outputs']
+            for name in self.variant_names:
+                output = derived[name]
+                variant_script = dict(script_data)
+                if VARIANTS[name]['aspect_ratio'] == '9:16' and '#Shorts' not in variant_script['title']:
+                    variant_script['title'] = f"{variant_script['title'][:90]} #Shorts"
+                
+                urls[name] = self.upload_to_youtube(output['path'], variant_script)
+                if topic_data:
+                    self.update_sheets(topic_data, urls[name], variant_script)
+        except Exception as e:
+            # The main video is already live, so a variant failure shouldn't fail the job
+            logger.error(f"Failed to publish variants: {str(e)}")
+        
+        return urls
+        
     def update_sheets(self, topic_data: Dict, video_url: str, script_data: Dict):
         """Update Google Sheets with published video info"""
         self.topics_sheet.update_cell(topic_data['row'], 2, 'Published')
@@ -229,11 +307,12 @@ class MultiClipVideoAutomation:
             0
         ])
         
-    def process_video(self):
+    def process_video(self, topic_data: Optional[Dict] = None):
         """Main workflow: Topic → Multi-Scene Script → Multiple Clips → Stitch → Upload"""
         try:
-            # Get next topic
-            topic_data = self.get_next_topic()
+            # Get next topic unless the caller already claimed one
+            if topic_data is None:
+                topic_data = self.get_next_topic()
             if not topic_data:
                 logger.info("No pending topics found")
                 return
@@ -246,12 +325,8 @@ class MultiClipVideoAutomation:
             # Generate multi-scene script
             script_data = self.generate_multi_scene_script(topic_data['topic'])
             
-            # Generate video clips for each scene
-            clip_paths = []
-            for scene in script_data['scenes']:
-                clip_path = self.generate_video_clip(scene, scene['scene_number'])
-                clip_paths.append(clip_path)
-                time.sleep(2)  # Brief pause between API calls
+            # Generate video clips for each scene, re-rendering any that fail QA
+            clip_paths = self.generate_checked_clips(script_data['scenes'])
             
             # Stitch clips together
             final_video_path = self.stitch_videos(clip_paths, script_data)
@@ -262,11 +337,14 @@ class MultiClipVideoAutomation:
             # Update sheets
             self.update_sheets(topic_data, video_url, script_data)
             
+            # Publish other formats of the same render
+            self.publish_variants(topic_data, final_video_path, script_data)
+            
             logger.success(f"30-second video published successfully: {video_url}")
             
         except Exception as e:
             logger.error(f"Error processing video: {str(e)}")
-            if 'topic_data' in locals():
+            if topic_data:
                 self.topics_sheet.update_cell(topic_data['row'], 2, 'Error')
             raise
 
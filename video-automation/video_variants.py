@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Multi-format derivation
+Produces several formats (16:9, 9:16, 1:1, preview) from one render in a
+single ffmpeg process, so one paid Veo render can feed every upload
+"""
+
+import os
+import re
+import time
+import subprocess
+from collections import deque
+from typing import Dict, List
+from loguru import logger
+
+# Full-quality outputs are re-encoded once; the preview trades quality for size
+HQ_ENCODE = ['-c:v', 'libx264', '-preset', 'medium', '-crf', '20', '-c:a', 'aac', '-b:a', '128k']
+PREVIEW_ENCODE = [
+    '-c:v', 'libx264', '-preset', 'veryfast',
+    '-b:v', '400k', '-maxrate', '500k', '-bufsize', '1000k',
+    '-c:a', 'aac', '-b:a', '64k'
+]
+
+# Filter chain per variant; {i} and {o} are the branch's input and output labels
+VARIANTS = {
+    'landscape': {
+        'filter': '[{i}]scale=1920:1080:force_original_aspect_ratio=increase,crop=1920:1080,setsar=1[{o}]',
+        'encode': HQ_ENCODE,
+        'aspect_ratio': '16:9'
+    },
+    'vertical_crop': {
+        'filter': '[{i}]scale=1080:1920:force_original_aspect_ratio=increase,crop=1080:1920,setsar=1[{o}]',
+        'encode': HQ_ENCODE,
+        'aspect_ratio': '9:16'
+    },
+    'vertical_blur': {
+        # Whole frame centred over a blurred, cropped copy of itself
+        'filter': (
+            '[{i}]split=2[{i}bg][{i}fg];'
+            '[{i}bg]scale=1080:1920:force_original_aspect_ratio=increase,crop=1080:1920,boxblur=20:5[{i}bgb];'
+            '[{i}fg]scale=1080:1920:force_original_aspect_ratio=decrease[{i}fgs];'
+            '[{i}bgb][{i}fgs]overlay=(W-w)/2:(H-h)/2,setsar=1[{o}]'
+        ),
+        'encode': HQ_ENCODE,
+        'aspect_ratio': '9:16'
+    },
+    'square': {
+        'filter': '[{i}]scale=1080:1080:force_original_aspect_ratio=increase,crop=1080:1080,setsar=1[{o}]',
+        'encode': HQ_ENCODE,
+        'aspect_ratio': '1:1'
+    },
+    'preview': {
+        'filter': '[{i}]scale=-2:360,setsar=1[{o}]',
+        'encode': PREVIEW_ENCODE,
+        'aspect_ratio': None
+    }
+}
+
+# Always derived alongside the published formats for the web UI, never uploaded
+PREVIEW_VARIANT = 'preview'
+
+# "bench: <user> user <sys> sys <real> real encode_video 1.0" (wording varies between ffmpeg versions)
+BENCH_LINE = re.compile(r'bench:\s+(\d+) user\s+(\d+) sys\s+(\d+) real .*?encode\w* (\d+)\.\d+')
+
+
+def variant_path(source_path: str, name: str) -> str:
+    """Where a variant of source_path is written"""
+    return f"{os.path.splitext(source_path)[0]}_{name}.mp4"
+
+
+def publish_variant_names() -> List[str]:
+    """Formats listed in PUBLISH_VARIANTS; the low-res preview is refused since uploads are public"""
+    names = [name.strip() for name in os.getenv('PUBLISH_VARIANTS', '').split(',') if name.strip()]
+    if PREVIEW_VARIANT in names:
+        raise ValueError(f"PUBLISH_VARIANTS cannot include '{PREVIEW_VARIANT}', it is only served locally")
+    unknown = [name for name in names if name not in VARIANTS]
+    if unknown:
+        raise ValueError(f"Unknown video variants in PUBLISH_VARIANTS: {', '.join(unknown)}")
+    return names
+
+
+def build_command(source_path: str, outputs: List[tuple]) -> List[str]:
+    """One decode of the source, split into a filter branch and encoder per output"""
+    labels = [f"v{idx}" for idx in range(len(outputs))]
+    graph = [f"[0:v]split={len(outputs)}" + ''.join(f"[{label}]" for label in labels)]
+    for idx, (name, _) in enumerate(outputs):
+        graph.append(VARIANTS[name]['filter'].format(i=labels[idx], o=f"out{idx}"))
+
+    cmd = ['ffmpeg', '-nostdin', '-y', '-hide_banner', '-nostats', '-benchmark_all', '-i', source_path,
+           '-filter_complex', ';'.join(graph)]
+    for idx, (name, path) in enumerate(outputs):
+        cmd += ['-map', f"[out{idx}]", '-map', '0:a?'] + VARIANTS[name]['encode']
+        cmd += ['-movflags', '+faststart', path]
+    return cmd
+
+
+def derive_variants(source_path: str, names: List[str]) -> Dict:
+    """Encode every requested variant in one ffmpeg pass; returns per-output paths, sizes and timings"""
+    unknown = [name for name in names if name not in VARIANTS]
+    if unknown:
+        raise ValueError(f"Unknown video variants: {', '.join(unknown)}")
+
+    outputs = [(name, variant_path(source_path, name)) for name in names]
+    encode_usec = {idx: 0 for idx in range(len(outputs))}
+
+    logger.info(f"Deriving {', '.join(names)} from {source_path} in one ffmpeg pass")
+    started = time.monotonic()
+    process = subprocess.Popen(
+        build_command(source_path, outputs),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True
+    )
+
+    # Stream stderr so the per-frame benchmark lines never pile up in memory
+    errors = deque(maxlen=5)
+    for line in process.stderr:
+        match = BENCH_LINE.search(line)
+        if match:
+            output_index, real_usec = int(match.group(4)), int(match.group(3))
+            # Threaded encoders in newer ffmpeg can report negative deltas, which print as wrapped values
+            if output_index in encode_usec and real_usec < 2 ** 63:
+                encode_usec[output_index] += real_usec
+        elif line.strip():
+            errors.append(line.strip())
+    process.wait()
+    wall_seconds = time.monotonic() - started
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, 'ffmpeg', stderr='\n'.join(errors))
+
+    # encode_seconds stays None when this ffmpeg build doesn't print encoder benchmarks
+    report = {}
+    for idx, (name, path) in enumerate(outputs):
+        report[name] = {
+            'path': path,
+            'size': os.path.getsize(path),
+            'encode_seconds': round(encode_usec[idx] / 1e6, 2) if encode_usec[idx] else None
+        }
+        logger.info(f"Variant {name}: {path} ({report[name]['size'] // 1024} KB, "
+                    f"encode {report[name]['encode_seconds']}s)")
+
+    logger.info(f"Derived {len(outputs)} variants in {wall_seconds:.1f}s")
+    return {'outputs': report, 'wall_seconds': round(wall_seconds, 2)}